@@ -1,5 +1,9 @@
 import streamlit as st
 import pandas as pd
+import plotly.graph_objects as go
+
+from exporter import render_export
+from model_comparison import METRICS, compare_models, snapshot_version
 from supabase_feedback import get_feedback_analysis
 
 
@@ -36,10 +40,84 @@ def show_feedback_analysis():
         st.dataframe(feedback_df, use_container_width=True)
         
         # Add export button
-        csv = feedback_df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="Download as CSV",
-            data=csv,
-            file_name='feedback_export.csv',
-            mime='text/csv',
+        render_export('feedback', snapshot_version(feedback_df), feedback_df, 'feedback_export')
+        
+        show_model_comparison(feedback_df)
+
+
+def show_model_comparison(feedback_df):
+    """Display bootstrap model comparison for the loaded feedback."""
+    st.markdown("---")
+    st.subheader("📈 Model Comparison")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        metric = st.selectbox(
+            "Metric",
+            [m for m in METRICS if m in feedback_df.columns],
+            format_func=lambda m: m.replace('_', ' ').title()
+        )
+    with col2:
+        n_resamples = st.select_slider(
+            "Bootstrap resamples",
+            options=[1000, 2000, 5000, 10000],
+            value=2000
+        )
+    with col3:
+        confidence = st.select_slider(
+            "Confidence level",
+            options=[0.90, 0.95, 0.99],
+            value=0.95,
+            format_func=lambda c: f"{c:.0%}"
+        )
+    
+    if metric is None:
+        st.info("No rating columns found in the feedback data.")
+        return
+    
+    comparison = compare_models(
+        snapshot_version(feedback_df), feedback_df, n_resamples, confidence
+    )
+    models = comparison['models']
+    if models.empty:
+        st.info("Not enough feedback to compare models.")
+        return
+    
+    direction = "higher is better" if METRICS[metric] else "lower is better"
+    summary = models[models['metric'] == metric].sort_values('mean', ascending=not METRICS[metric])
+    fig = go.Figure(go.Bar(
+        x=summary['model_name'],
+        y=summary['mean'],
+        error_y=dict(
+            type='data',
+            symmetric=False,
+            array=summary['ci_high'] - summary['mean'],
+            arrayminus=summary['mean'] - summary['ci_low']
+        ),
+        text=[f"n={n}" for n in summary['n']]
+    ))
+    fig.update_layout(
+        title=f"Mean {metric.replace('_', ' ')} with {confidence:.0%} bootstrap CI ({direction})",
+        yaxis_title=metric.replace('_', ' ').title()
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.markdown("**Per-model summary**")
+    st.dataframe(
+        models.pivot_table(index='model_name', columns='metric', values=['mean', 'ci_low', 'ci_high']).round(3),
+        use_container_width=True
+    )
+    
+    rates = comparison['win_rates'].get(metric)
+    if rates is not None and len(rates) > 1:
+        st.markdown(f"**Pairwise win rates** (row beats column on {metric.replace('_', ' ')})")
+        st.dataframe(rates.style.format("{:.0%}", na_rep="–"), use_container_width=True)
+    
+    problems = comparison['problems']
+    if not problems.empty:
+        st.markdown("**Per-problem means**")
+        per_problem = problems[problems['metric'] == metric]
+        st.dataframe(
+            per_problem.pivot_table(index='problem_id', columns='model_name', values='mean').round(2),
+            use_container_width=True
         )
@@ -22,7 +22,10 @@ AVAILABLE_MODELS = {
     "Claude 3.7 Sonnet": "anthropic/claude-3.7-sonnet"
 }
 
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_BASE_URL = os.getenv(
+    'OPENROUTER_BASE_URL',
+    "https://openrouter.ai/api/v1"
+)
 
 # Supabase Configuration
 SUPABASE_URL = os.getenv(
@@ -48,3 +51,69 @@ DEFAULT_DATASET_PATH = os.getenv(
 # Other Configuration Settings
 MAX_TOKENS = int(os.getenv('MAX_TOKENS', 800))
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.2)) 
+CACHE_DIR = os.getenv('PROMPTVIX_CACHE_DIR', '.promptvix_cache')
+
+# Token Budget Settings (per problem complexity, refined from observed usage)
+DEFAULT_TOKEN_BUDGETS = {
+    'Easy': MAX_TOKENS,
+    'Medium': int(os.getenv('TOKEN_BUDGET_MEDIUM', 1200)),
+    'Complex': int(os.getenv('TOKEN_BUDGET_COMPLEX', 2000)),
+    'Refinement': int(os.getenv('TOKEN_BUDGET_REFINEMENT', 600))
+}
+MIN_TOKEN_BUDGET = int(os.getenv('MIN_TOKEN_BUDGET', 256))
+MAX_TOKEN_BUDGET = int(os.getenv('MAX_TOKEN_BUDGET', 4096))
+TOKEN_BUDGET_HEADROOM = float(os.getenv('TOKEN_BUDGET_HEADROOM', 1.3))
+TOKEN_BUDGET_MIN_SAMPLES = int(os.getenv('TOKEN_BUDGET_MIN_SAMPLES', 5))
+MAX_CONTINUATIONS = int(os.getenv('MAX_CONTINUATIONS', 2))
+
+# Figure Post-processing Settings
+PLOTLY_WEBGL_THRESHOLD = int(os.getenv('PLOTLY_WEBGL_THRESHOLD', 1000))
+PLOTLY_MAX_POINTS = int(os.getenv('PLOTLY_MAX_POINTS', 5000))
+MATPLOTLIB_RASTERIZE_THRESHOLD = int(os.getenv('MATPLOTLIB_RASTERIZE_THRESHOLD', 5000))
+
+# Similarity Index Settings (instant reuse of top-rated prior code)
+SIMILARITY_MIN_SCORE = float(os.getenv('SIMILARITY_MIN_SCORE', 0.6))
+SIMILARITY_MIN_RATING = float(os.getenv('SIMILARITY_MIN_RATING', 3.5))
+SIMILARITY_REFRESH_SECONDS = int(os.getenv('SIMILARITY_REFRESH_SECONDS', 60))
+
+# Market Basket Settings
+BASKET_TOP_K = int(os.getenv('BASKET_TOP_K', 50))
+
+# Offline Geocoding Settings (bundled lookup tables; postal table is optional)
+GEOCODE_CITY_PATH = os.getenv('GEOCODE_CITY_PATH', 'data/us_city_coordinates.csv')
+GEOCODE_STATE_PATH = os.getenv('GEOCODE_STATE_PATH', 'data/us_state_centroids.csv')
+GEOCODE_POSTAL_PATH = os.getenv('GEOCODE_POSTAL_PATH', 'data/us_postal_coordinates.csv')
+
+# Result History Settings (per-user, stored under CACHE_DIR)
+HISTORY_MAX_BYTES = int(os.getenv('HISTORY_MAX_BYTES', 200 * 1024 * 1024))
+HISTORY_MAX_ITERATIONS_PER_USER = int(os.getenv('HISTORY_MAX_ITERATIONS_PER_USER', 50))
+
+# Feedback Analysis Settings
+BOOTSTRAP_MAX_ELEMENTS = int(os.getenv('BOOTSTRAP_MAX_ELEMENTS', 20_000_000))
+
+# Speculative Prefetch Settings (opt-in per session)
+SPECULATIVE_DAILY_BUDGET = int(os.getenv('SPECULATIVE_DAILY_BUDGET', 300))
+COMPLETION_CACHE_TTL = int(os.getenv('COMPLETION_CACHE_TTL', 900))
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv('COMPLETION_CACHE_MAX_ENTRIES', 256))
+
+# Plotly Transport Settings (steps across the data range kept by rounding)
+FIGURE_PRECISION_STEPS = int(os.getenv('FIGURE_PRECISION_STEPS', 100_000))
+FIGURE_CACHE_MAX_ENTRIES = int(os.getenv('FIGURE_CACHE_MAX_ENTRIES', 64))
+
+# Execution Profiling Settings (opt-in per session)
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', 10))
+
+# Generation Service Settings (empty URL = generate in the Streamlit process)
+GENERATION_SERVICE_URL = os.getenv('GENERATION_SERVICE_URL', '')
+GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', 4))
+GENERATION_QUEUE_SIZE = int(os.getenv('GENERATION_QUEUE_SIZE', 100))
+GENERATION_JOB_RETENTION = int(os.getenv('GENERATION_JOB_RETENTION', 500))
+GENERATION_JOB_TTL = int(os.getenv('GENERATION_JOB_TTL', 3600))
+GENERATION_MAX_DATASETS = int(os.getenv('GENERATION_MAX_DATASETS', 4))
+GENERATION_POLL_TIMEOUT = int(os.getenv('GENERATION_POLL_TIMEOUT', 300))
+GENERATION_RENDER_PROCESSES = int(os.getenv('GENERATION_RENDER_PROCESSES', os.cpu_count() or 2))
+GENERATION_MAX_BODY_BYTES = int(os.getenv('GENERATION_MAX_BODY_BYTES', 200 * 1024 * 1024))
+
+# Export Settings (export files are kept under CACHE_DIR/exports)
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 50_000))
+EXPORT_CACHE_MAX_ENTRIES = int(os.getenv('EXPORT_CACHE_MAX_ENTRIES', 8))
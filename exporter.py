@@ -0,0 +1,230 @@
+"""On-demand, cached exports of the dataset and feedback tables.
+
+Download buttons used to serialize their whole table on every rerun. Here
+an export is built only when the user asks for it and written in row
+chunks to a file under the cache directory, named after the data's
+version. Reruns and other sessions reuse that file without serializing
+again, and the payload is never held in memory as a whole while building.
+
+CSV and JSONL are always available; Parquet needs the optional ``pyarrow``
+package.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+from config import CACHE_DIR, EXPORT_CACHE_MAX_ENTRIES, EXPORT_CHUNK_ROWS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_DIR = os.path.join(CACHE_DIR, 'exports')
+
+# Serializes building and pruning of export files within the process
+_build_lock = threading.Lock()
+
+# Format name to (file extension, MIME type)
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'JSONL': ('jsonl', 'application/x-ndjson'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def available_formats():
+    """Return the export formats usable in this environment.
+
+    Returns:
+        list: Format names, CSV first
+    """
+    return [fmt for fmt in FORMATS if fmt != 'Parquet' or pq is not None]
+
+
+def _iter_chunks(df, chunk_rows):
+    """Yield consecutive row slices of a DataFrame."""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _to_text(value):
+    """Render one value of a mixed-type column as text (JSON for containers)."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    return str(value)
+
+
+def _parquet_frame(chunk):
+    """Cast object columns to strings so mixed-type values convert to Arrow."""
+    objects = [column for column in chunk.columns if chunk[column].dtype == object]
+    if not objects:
+        return chunk
+    return chunk.assign(**{column: chunk[column].map(_to_text) for column in objects})
+
+
+def _parquet_schema(df):
+    """Build the Arrow schema of an export, with object columns as strings."""
+    schema = pa.Schema.from_pandas(_parquet_frame(df.head(0)), preserve_index=False)
+    for column in df.columns:
+        if df[column].dtype == object:
+            index = schema.get_field_index(str(column))
+            schema = schema.set(index, pa.field(str(column), pa.string()))
+    return schema
+
+
+def write_export(df, fmt, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Serialize a DataFrame to a binary file in row chunks.
+
+    Args:
+        df (pd.DataFrame): Table to export
+        fmt (str): One of ``FORMATS``
+        out (file): Binary file object to write to
+        chunk_rows (int): Rows serialized per chunk
+    """
+    if fmt == 'Parquet':
+        if pq is None:
+            raise ValueError("Parquet export requires the pyarrow package")
+        schema = _parquet_schema(df)
+        with pq.ParquetWriter(out, schema) as writer:
+            for chunk in _iter_chunks(df, chunk_rows):
+                writer.write_table(
+                    pa.Table.from_pandas(_parquet_frame(chunk), schema=schema, preserve_index=False)
+                )
+        return
+
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    try:
+        if fmt == 'CSV':
+            # The header is written even for an empty table
+            df.head(0).to_csv(text, index=False)
+            for chunk in _iter_chunks(df, chunk_rows):
+                chunk.to_csv(text, index=False, header=False)
+        elif fmt == 'JSONL':
+            for chunk in _iter_chunks(df, chunk_rows):
+                lines = chunk.to_json(orient='records', lines=True, date_format='iso')
+                # Older pandas omits the final newline
+                text.write(lines if lines.endswith('\n') else lines + '\n')
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        text.flush()
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+def export_path(name, version, fmt):
+    """Return the file an export of (name, version, format) is stored in."""
+    key = hashlib.blake2b(f"{name}|{version}|{fmt}".encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(EXPORT_DIR, f"{name}-{key}.{FORMATS[fmt][0]}")
+
+
+def _prune_exports(keep):
+    """Delete the least recently used export files beyond the cap."""
+    try:
+        entries = [os.path.join(EXPORT_DIR, entry) for entry in os.listdir(EXPORT_DIR)]
+    except OSError:
+        return
+    files = sorted(
+        (path for path in entries if os.path.isfile(path) and path != keep and '.tmp-' not in path),
+        key=os.path.getmtime, reverse=True
+    )
+    for path in files[max(0, EXPORT_CACHE_MAX_ENTRIES - 1):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def build_export(name, version, fmt, df):
+    """Build an export file once per (name, version, format).
+
+    Args:
+        name (str): Which table is exported (part of the file key)
+        version (str): Dataset fingerprint or feedback snapshot version
+        fmt (str): One of ``FORMATS``
+        df (pd.DataFrame): Table to export
+
+    Returns:
+        str: Path of the export file, shared by all sessions
+    """
+    path = export_path(name, version, fmt)
+    with _build_lock:
+        if os.path.exists(path):
+            # Mark as recently used
+            os.utime(path)
+            return path
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        try:
+            with open(tmp_path, 'wb') as out:
+                write_export(df, fmt, out)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _prune_exports(keep=path)
+    return path
+
+
+def _export_reader(name, version, fmt, df):
+    """Return a callable that reads an export file when its download is clicked.
+
+    The file is only opened on click, and rebuilt if it was pruned after
+    being prepared.
+    """
+    def read():
+        path = build_export(name, version, fmt, df)
+        with open(path, 'rb') as export_file:
+            return export_file.read()
+    return read
+
+
+def render_export(name, version, df, file_stem, label="📥 Download"):
+    """Show export controls that serialize only after the user asks.
+
+    The first click on "Prepare" writes the export file; afterwards the
+    download button is served from that file until the data version changes.
+    The file is read only when the download is clicked.
+
+    Args:
+        name (str): Which table is exported; also keys the widgets
+        version (str): Dataset fingerprint or feedback snapshot version
+        df (pd.DataFrame): Table to export
+        file_stem (str): Download file name without extension
+        label (str): Download button label
+    """
+    state_key = f"export_prepared_{name}"
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        fmt = st.selectbox("Export format", available_formats(), key=f"export_format_{name}")
+    with col2:
+        if st.session_state.get(state_key) != (version, fmt):
+            if st.button(f"Prepare {fmt} export", key=f"export_prepare_{name}"):
+                st.session_state[state_key] = (version, fmt)
+        if st.session_state.get(state_key) == (version, fmt):
+            try:
+                with st.spinner(f"Preparing {fmt} export..."):
+                    build_export(name, version, fmt, df)
+            except Exception as e:
+                st.session_state.pop(state_key, None)
+                st.error(f"Export failed: {e}")
+                return
+            extension, mime = FORMATS[fmt]
+            st.download_button(
+                label=f"{label} ({fmt})",
+                data=_export_reader(name, version, fmt, df),
+                file_name=f"{file_stem}.{extension}",
+                mime=mime,
+                key=f"export_download_{name}"
+            )
@@ -0,0 +1,262 @@
+"""Post-processing of captured figures so large datasets stay cheap to render."""
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from config import (
+    MATPLOTLIB_RASTERIZE_THRESHOLD,
+    PLOTLY_MAX_POINTS,
+    PLOTLY_WEBGL_THRESHOLD,
+)
+
+# Per-point attributes that must be subset together with x/y
+POINT_ATTRIBUTES = [
+    ('x',), ('y',), ('text',), ('hovertext',), ('customdata',), ('ids',),
+    ('marker', 'size'), ('marker', 'color'), ('marker', 'symbol'),
+    ('marker', 'opacity'),
+]
+
+# Trace types downsampled by optimize_plotly_figure; Plotly Express emits
+# 'scattergl' on its own above 1000 points
+DOWNSAMPLED_TYPES = ('scatter', 'scattergl')
+
+# Agg path chunk size used while saving figures with long lines
+AGG_PATH_CHUNKSIZE = 10000
+
+# Scatter properties that Scattergl does not support
+WEBGL_UNSUPPORTED = ['cliponaxis', 'stackgroup', 'stackgaps', 'groupnorm', 'orientation', 'hoveron']
+
+
+def _to_numeric(values):
+    """Convert an axis array to floats for distance computations.
+
+    Args:
+        values (array-like): Axis values (numbers, dates or categories)
+
+    Returns:
+        np.ndarray: Float array; categorical axes fall back to positions
+    """
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.number):
+        return arr.astype(float)
+    try:
+        return pd.to_datetime(arr).values.astype('int64').astype(float)
+    except (TypeError, ValueError):
+        return np.arange(len(arr), dtype=float)
+
+
+def lttb_indices(x, y, n_out):
+    """Select indices with Largest-Triangle-Three-Buckets downsampling.
+
+    LTTB keeps the visual shape of a line (peaks, troughs and trends) while
+    reducing it to a fixed number of points.
+
+    Args:
+        x (np.ndarray): Numeric x values, sorted for line traces
+        y (np.ndarray): Numeric y values
+        n_out (int): Number of points to keep
+
+    Returns:
+        np.ndarray: Sorted indices into the original arrays
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs(
+            (x[previous] - avg_x) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return np.unique(selected)
+
+
+def grid_bin_indices(x, y, n_out):
+    """Select one representative point per occupied cell of a 2D grid.
+
+    Unlike random sampling this keeps outliers and the overall point
+    density outline, which is what a dense scatter plot communicates.
+
+    Args:
+        x (np.ndarray): Numeric x values
+        y (np.ndarray): Numeric y values
+        n_out (int): Approximate number of points to keep
+
+    Returns:
+        np.ndarray: Sorted indices into the original arrays
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+
+    bins = max(int(np.sqrt(n_out)), 1)
+
+    def _bin(values):
+        low, high = np.nanmin(values), np.nanmax(values)
+        if not np.isfinite(low) or high <= low:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.clip(((values - low) / (high - low) * bins).astype(np.int64), 0, bins - 1)
+
+    cells = _bin(x) * bins + _bin(y)
+    _, first = np.unique(cells, return_index=True)
+    return np.sort(first)
+
+
+def _get_path(trace, path):
+    """Read a nested attribute such as ('marker', 'size') from a trace dict."""
+    value = trace
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _set_path(trace, path, value):
+    """Write a nested attribute such as ('marker', 'size') on a trace dict."""
+    target = trace
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
+
+
+def _downsample_trace(trace, max_points):
+    """Downsample a scatter trace dict in place.
+
+    Args:
+        trace (dict): Plotly trace as returned by ``to_plotly_json()``
+        max_points (int): Maximum number of points to keep
+
+    Returns:
+        bool: True if the trace was downsampled
+    """
+    y = trace.get('y')
+    if y is None:
+        return False
+    n = len(y)
+    if n <= max_points:
+        return False
+
+    x = trace.get('x')
+    x_num = _to_numeric(x) if x is not None else np.arange(n, dtype=float)
+    y_num = _to_numeric(y)
+    valid = np.flatnonzero(np.isfinite(x_num) & np.isfinite(y_num))
+    if len(valid) <= max_points:
+        return False
+
+    mode = trace.get('mode') or ('lines' if n > 20 else 'lines+markers')
+    if 'lines' in mode:
+        keep = valid[lttb_indices(x_num[valid], y_num[valid], max_points)]
+    else:
+        keep = valid[grid_bin_indices(x_num[valid], y_num[valid], max_points)]
+
+    for path in POINT_ATTRIBUTES:
+        value = _get_path(trace, path)
+        if value is not None and not isinstance(value, str) and np.ndim(value) > 0 and len(value) == n:
+            _set_path(trace, path, np.asarray(value)[keep])
+    return True
+
+
+def optimize_plotly_figure(fig, max_points=PLOTLY_MAX_POINTS, webgl_threshold=PLOTLY_WEBGL_THRESHOLD):
+    """Bound the payload and render cost of a Plotly figure.
+
+    Dense ``scatter`` and ``scattergl`` traces are downsampled (LTTB for
+    lines, grid binning for markers) and ``scatter`` traces above the WebGL
+    threshold are converted to ``scattergl`` so the browser draws them on
+    the GPU.
+
+    Args:
+        fig (go.Figure): Figure produced by generated code
+        max_points (int): Maximum points kept per scatter trace
+        webgl_threshold (int): Point count above which traces use WebGL
+
+    Returns:
+        go.Figure: Optimized figure, or the original if nothing changed
+    """
+    if fig.frames:
+        # Animated figures keep per-frame traces in sync; leave them untouched
+        return fig
+
+    changed = False
+    traces = []
+    for trace in fig.data:
+        trace_json = trace.to_plotly_json()
+        if trace.type in DOWNSAMPLED_TYPES and trace_json.get('y') is not None:
+            n = len(trace_json['y'])
+            changed |= _downsample_trace(trace_json, max_points)
+            if trace.type == 'scatter' and n > webgl_threshold and 'stackgroup' not in trace_json:
+                for key in WEBGL_UNSUPPORTED:
+                    trace_json.pop(key, None)
+                trace_json['type'] = 'scattergl'
+                changed = True
+        traces.append(trace_json)
+
+    if not changed:
+        return fig
+    return go.Figure(data=traces, layout=fig.layout, skip_invalid=True)
+
+
+def optimize_matplotlib_figure(fig, threshold=MATPLOTLIB_RASTERIZE_THRESHOLD):
+    """Rasterize dense artists of a matplotlib figure.
+
+    Collections (scatter, hexbin, line collections) and lines with more
+    elements than ``threshold`` are drawn as a single bitmap instead of one
+    vector path per element.
+
+    Args:
+        fig (matplotlib.figure.Figure): Figure produced by generated code
+        threshold (int): Element count above which artists are rasterized
+
+    Returns:
+        bool: True if any artist was rasterized
+    """
+    dense = False
+    for ax in fig.get_axes():
+        for collection in ax.collections:
+            size = max(len(collection.get_offsets()), len(collection.get_paths()))
+            if size > threshold:
+                collection.set_rasterized(True)
+                dense = True
+        for line in ax.get_lines():
+            if len(line.get_xydata()) > threshold:
+                line.set_rasterized(True)
+                dense = True
+    return dense
+
+
+def save_matplotlib_figure(fig, out, threshold=MATPLOTLIB_RASTERIZE_THRESHOLD, **savefig_kwargs):
+    """Rasterize dense artists and save a matplotlib figure.
+
+    Long lines of dense figures are chunked so Agg never overflows its path
+    limit; the chunk size only applies while saving, leaving the global
+    rcParams untouched.
+
+    Args:
+        fig (matplotlib.figure.Figure): Figure produced by generated code
+        out (file): File object to save to
+        threshold (int): Element count above which artists are rasterized
+        **savefig_kwargs: Passed to ``Figure.savefig``
+    """
+    dense = optimize_matplotlib_figure(fig, threshold)
+    with matplotlib.rc_context({'agg.path.chunksize': AGG_PATH_CHUNKSIZE} if dense else {}):
+        fig.savefig(out, **savefig_kwargs)
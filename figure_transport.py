@@ -0,0 +1,493 @@
+"""Compact serialization of Plotly figures for storage and transfer.
+
+Figures are stored and sent to the browser as JSON. Point data from raw
+rows makes that JSON large, so before serialization:
+
+- coordinates that are plotted but not shown in the hover label are
+  rounded to display precision (a fraction of the data range far below
+  one pixel),
+- x/y values shown in the hover label of cartesian traces are rounded to
+  the decimals that label displays (the axis or template format, or
+  plotly.js's default hover precision), so the text users read is
+  unchanged; values whose label format is unknown keep full precision,
+- numeric arrays, including the typed arrays plotly already emits, are
+  encoded as base64 typed arrays (``{'dtype', 'bdata'}``, which
+  plotly.js >= 2.28 decodes natively) using the smallest exact dtype, or
+  as plain JSON lists when the rounded numbers are shorter that way,
+- text, hovertext and customdata that repeat one value for every point are
+  collapsed to a scalar or inlined into the hovertemplate.
+
+``st.plotly_chart`` re-serializes figures with ``plotly.io.to_json``, which
+keeps these encodings, so the savings reach the browser. Encoded payloads
+are cached by figure hash and decoded payloads by content hash, so reruns
+neither compact nor parse a figure again.
+"""
+
+import base64
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.io as pio
+
+from config import FIGURE_CACHE_MAX_ENTRIES, FIGURE_PRECISION_STEPS
+
+# Arrays shorter than this are left as plain JSON lists
+MIN_TYPED_LENGTH = 16
+
+# Positional attributes rounded to display precision
+COORDINATE_KEYS = {'x', 'y', 'z', 'lat', 'lon', 'r', 'theta', 'a', 'b', 'c', 'u', 'v', 'w'}
+
+# Numeric attributes encoded exactly (e.g. treemap values must keep their sums)
+EXACT_KEYS = {
+    'values', 'open', 'high', 'low', 'close', 'base', 'width',
+    'surfacecolor', 'intensity', 'i', 'j', 'k',
+}
+MARKER_KEYS = {'size', 'color', 'opacity'}
+
+# Decimal places kept for geographic coordinates (about 1 m)
+GEO_DECIMALS = 5
+
+INTEGER_DTYPES = ['u1', 'i1', 'u2', 'i2', 'u4', 'i4']
+
+CUSTOMDATA_REF = re.compile(r"%\{customdata(?:\[(\d+)\])?(:[^}]*)?\}")
+# Attribute name and optional d3 format of a hovertemplate reference
+TEMPLATE_REF = re.compile(r"%\{(\w+)(?:\[\d+\])?(?::([^}]*))?\}")
+
+# d3 formats with a known number of decimals: '.2f', ',.1%', '$,d'
+FIXED_FORMAT = re.compile(r"(?:.?[<>=^])?[-+( ]?[$#]?0?\d*,?(?:\.(\d+))?~?([f%d])")
+
+# plotly.js default hover labels on linear axes show 6 - floor(log10|v| + 0.01)
+# decimals (two past the leading digit plus four hover digits)
+HOVER_DIGITS = 6
+
+# Trace types whose hover label shows each point's own x/y through the axis format
+HOVER_ROUNDED_TYPES = {'scatter', 'scattergl', 'bar'}
+
+# Attributes the default hover label shows ('all' hoverinfo)
+DEFAULT_HOVER_KEYS = {'x', 'y', 'z', 'lat', 'lon', 'r', 'theta', 'a', 'b', 'c', 'u', 'v', 'w'}
+
+_payload_cache = OrderedDict()
+_payload_cache_lock = threading.Lock()
+
+# Encoded payloads keyed by the hash of the figure's plain JSON
+_encoded_cache = OrderedDict()
+_encoded_cache_lock = threading.Lock()
+
+
+def decode_typed_array(spec):
+    """Decode a plotly.js typed array spec into an ndarray.
+
+    Args:
+        spec (dict): {'dtype', 'bdata'} plus optional 'shape' ("rows, cols" or a list)
+
+    Returns:
+        np.ndarray: Decoded array, or None if ``spec`` is not a typed array
+    """
+    if not isinstance(spec, dict) or 'bdata' not in spec or 'dtype' not in spec:
+        return None
+    try:
+        arr = np.frombuffer(base64.b64decode(spec['bdata']), dtype='<' + spec['dtype'])
+        shape = spec.get('shape')
+        if shape:
+            if isinstance(shape, str):
+                shape = [int(part) for part in shape.split(',')]
+            arr = arr.reshape([int(part) for part in shape])
+    except (TypeError, ValueError):
+        return None
+    return arr
+
+
+def _numeric_array(values):
+    """Return values as a numeric ndarray, or None if they are not numeric."""
+    if isinstance(values, dict):
+        return decode_typed_array(values)
+    if isinstance(values, (str, bytes)) or np.isscalar(values):
+        return None
+    try:
+        arr = np.asarray(values)
+    except (ValueError, TypeError):
+        return None
+    if arr.dtype == bool or not np.issubdtype(arr.dtype, np.number) or arr.ndim not in (1, 2):
+        return None
+    return arr
+
+
+def round_to_display(arr, geo=False, steps=FIGURE_PRECISION_STEPS):
+    """Round coordinates to a precision no display can resolve.
+
+    Args:
+        arr (np.ndarray): Float coordinates
+        geo (bool): Use a fixed precision for latitude/longitude
+        steps (int): Number of distinguishable steps across the data range
+
+    Returns:
+        tuple: (rounded array, resolution step)
+    """
+    if geo:
+        return np.round(arr, GEO_DECIMALS), 10.0 ** -GEO_DECIMALS
+    finite = arr[np.isfinite(arr)]
+    if not len(finite):
+        return arr, 0.0
+    span = float(finite.max() - finite.min()) or float(np.abs(finite).max()) or 1.0
+    decimals = int(np.clip(np.ceil(-np.log10(span / steps)), 0, 15))
+    return np.round(arr, decimals), 10.0 ** -decimals
+
+
+def typed_array(arr, tolerance=0.0):
+    """Encode an array as a plotly.js typed array spec.
+
+    Integral data uses the smallest integer dtype; floats use float32 when
+    that stays within ``tolerance`` of the values, else float64.
+
+    Args:
+        arr (np.ndarray): 1-D or 2-D numeric array
+        tolerance (float or np.ndarray): Largest acceptable absolute error,
+            overall or per element
+
+    Returns:
+        dict: {'dtype', 'bdata'} plus 'shape' for 2-D arrays
+    """
+    arr = np.asarray(arr)
+    finite = np.isfinite(arr) if arr.dtype.kind == 'f' else np.ones(arr.shape, dtype=bool)
+    encoded = None
+    if finite.all() and (arr.dtype.kind in 'iu' or np.array_equal(arr, np.round(arr))):
+        low, high = (arr.min(), arr.max()) if arr.size else (0, 0)
+        for code in INTEGER_DTYPES:
+            info = np.iinfo(code)
+            if info.min <= low and high <= info.max:
+                encoded = code, arr.astype('<' + code)
+                break
+    if encoded is None:
+        as_f4 = arr.astype('<f4')
+        with np.errstate(invalid='ignore', over='ignore'):
+            error = np.abs(as_f4.astype(float) - arr.astype(float))
+        allowed = np.broadcast_to(np.maximum(tolerance, 0.0), arr.shape)
+        fits = np.all(error[finite] <= allowed[finite]) and np.isfinite(as_f4[finite]).all()
+        encoded = ('f4', as_f4) if fits else ('f8', arr.astype('<f8'))
+
+    code, values = encoded
+    spec = {
+        'dtype': code,
+        'bdata': base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii'),
+    }
+    if values.ndim == 2:
+        # Same form as plotly.py's own typed arrays
+        spec['shape'] = f"{values.shape[0]}, {values.shape[1]}"
+    return spec
+
+
+def _format_decimals(spec):
+    """Return the decimals a d3 number format shows, or None if unknown."""
+    match = FIXED_FORMAT.fullmatch(spec)
+    if match is None:
+        return None
+    precision, kind = match.groups()
+    if kind == 'd':
+        return 0
+    decimals = 6 if precision is None else int(precision)
+    return decimals + 2 if kind == '%' else decimals
+
+
+def _default_hover_decimals(arr):
+    """Decimals plotly.js shows for each value in a default linear-axis hover label."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(arr)) + 0.01)
+    return np.minimum(HOVER_DIGITS - np.nan_to_num(magnitude, posinf=0, neginf=0), 20).astype(int)
+
+
+def round_to_hover(arr, decimals=None):
+    """Round values to the decimals their hover label shows.
+
+    Values that a different rounding rule could label differently (near
+    ties, next to a change in the default precision, or outside the range
+    plotly.js prints in plain notation) keep their exact value.
+
+    Args:
+        arr (np.ndarray): Float values
+        decimals (int): Fixed decimals of the label format; None for the
+            plotly.js default hover precision
+
+    Returns:
+        tuple: (rounded array, per-element tolerance for typed_array)
+    """
+    digits = _default_hover_decimals(arr) if decimals is None else np.full(arr.shape, decimals)
+    power = 10.0 ** np.abs(digits)
+    with np.errstate(invalid='ignore', over='ignore'):
+        scaled = np.where(digits >= 0, arr * power, arr / power)
+        whole = np.round(scaled)
+        rounded = np.where(digits >= 0, whole / power, whole * power)
+        keep = (~np.isfinite(scaled) | (np.abs(scaled) > 2.0 ** 52)
+                | (np.abs(np.abs(scaled - whole) - 0.5) < 1e-6)
+                | (np.abs(arr) < 1e-6) | (np.abs(arr) >= 1e21))
+    tolerance = 0.45 / power if decimals is None else np.full(arr.shape, 0.45 * 10.0 ** -decimals)
+    if decimals is None:
+        # The precision is chosen per value, so it must not move with rounding
+        keep |= _default_hover_decimals(rounded) != digits
+        keep |= _default_hover_decimals(rounded.astype('<f4').astype(float)) != digits
+    return np.where(keep, arr, rounded), np.where(keep, 0.0, tolerance)
+
+
+def _hover_decimals(trace, key, layout):
+    """Return the decimals the hover label shows for a trace's x or y.
+
+    Returns:
+        tuple: (known, decimals) where decimals is None for the plotly.js
+        default hover precision; known is False if the label format cannot
+        be mirrored and the values must stay exact
+    """
+    if trace.get('type', 'scatter') not in HOVER_ROUNDED_TYPES or key not in ('x', 'y'):
+        return False, None
+    axis_name = f"{key}axis{str(trace.get(f'{key}axis', key))[1:]}"
+    template_layout = ((layout.get('template') or {}).get('layout') or {})
+    axis = {**(template_layout.get(axis_name) or {}), **(layout.get(axis_name) or {})}
+    if axis.get('type', 'linear') not in ('linear', '-') or axis.get('showexponent') == 'none' \
+            or axis.get('tickformatstops'):
+        return False, None
+    axis_format = trace.get(f'{key}hoverformat') or axis.get('hoverformat') or axis.get('tickformat')
+
+    specs = []
+    for template_key in ('hovertemplate', 'texttemplate'):
+        template = trace.get(template_key)
+        if isinstance(template, str):
+            specs.extend(spec for name, spec in TEMPLATE_REF.findall(template) if name == key)
+    if not isinstance(trace.get('hovertemplate'), str) or not specs:
+        specs.append('')
+    known = []
+    for spec in specs:
+        spec = spec or axis_format
+        if not spec:
+            known.append(None)
+            continue
+        decimals = _format_decimals(spec)
+        if decimals is None:
+            return False, None
+        known.append(decimals)
+    if None in known:
+        # The default precision is at least as fine as any fixed format up to 6 decimals
+        fixed = [decimals for decimals in known if decimals is not None]
+        return (False, None) if any(decimals > 6 for decimals in fixed) else (True, None)
+    return True, max(known)
+
+
+def _plain_list(arr):
+    """Return an array as JSON-ready nested lists (NaN as null)."""
+    values = arr.astype(object)
+    if arr.dtype.kind == 'f':
+        values[~np.isfinite(arr)] = None
+    return values.tolist()
+
+
+def _compact_value(key, values, geo=False, exact=False, hover=None):
+    """Compact one attribute value; returns it unchanged if not applicable.
+
+    Coordinates are rounded to display precision unless ``exact`` is set,
+    or to the decimals of their hover label when ``hover`` is
+    ``(True, decimals)``. The result is a typed array or a plain list,
+    whichever serializes shorter.
+    """
+    arr = _numeric_array(values)
+    if arr is None or arr.size < MIN_TYPED_LENGTH:
+        return values
+    tolerance = 0.0
+    if hover is not None and hover[0] and arr.dtype.kind == 'f':
+        arr, tolerance = round_to_hover(arr.astype(float), hover[1])
+    elif key in COORDINATE_KEYS and not exact:
+        arr = arr.astype(float)
+        arr, step = round_to_display(arr, geo=geo and key in ('lat', 'lon'))
+        tolerance = step / 2
+    spec = typed_array(arr, tolerance)
+    plain = _plain_list(arr)
+    if len(json.dumps(plain, separators=(',', ':'))) < len(json.dumps(spec, separators=(',', ':'))):
+        return plain
+    return spec
+
+
+def _collapse_constant(values):
+    """Return the single value of a list that repeats it, else None."""
+    if not isinstance(values, (list, tuple, np.ndarray)) or len(values) < 2:
+        return None
+    first = values[0]
+    if isinstance(first, (list, tuple, dict, np.ndarray)):
+        return None
+    if all(value == first for value in values[1:]):
+        return first
+    return None
+
+
+def _compact_customdata(trace):
+    """Inline customdata columns that are constant into the hovertemplate.
+
+    Only references without a format spec (``%{customdata[i]}``) can be
+    inlined; other columns are kept and re-indexed.
+    """
+    customdata = trace.get('customdata')
+    template = trace.get('hovertemplate')
+    if customdata is None or not isinstance(template, str) or 'customdata' in str(trace.get('texttemplate', '')):
+        return
+    rows = list(customdata)
+    if not rows:
+        return
+    two_d = isinstance(rows[0], (list, tuple, np.ndarray))
+    columns = [list(column) for column in zip(*rows)] if two_d else [rows]
+    formatted = {int(index or 0) for index, spec in CUSTOMDATA_REF.findall(template) if spec}
+
+    constants = {}
+    for index, column in enumerate(columns):
+        value = _collapse_constant(column)
+        # Floats are left to plotly's number formatting
+        if value is not None and index not in formatted and not isinstance(value, float):
+            constants[index] = value
+    if not constants:
+        return
+
+    kept = [index for index in range(len(columns)) if index not in constants]
+    new_index = {old: new for new, old in enumerate(kept)}
+
+    def _replace(match):
+        index = int(match.group(1) or 0)
+        if index in constants:
+            return str(constants[index])
+        return f"%{{customdata[{new_index[index]}]{match.group(2) or ''}}}"
+
+    trace['hovertemplate'] = CUSTOMDATA_REF.sub(_replace, template)
+    if kept:
+        trace['customdata'] = [list(row) for row in zip(*(columns[index] for index in kept))]
+    else:
+        del trace['customdata']
+
+
+def _hover_keys(trace):
+    """Return the attributes whose values the trace's hover label shows."""
+    template = trace.get('hovertemplate')
+    if isinstance(template, str):
+        return {name for name, _ in TEMPLATE_REF.findall(template)}
+    hoverinfo = trace.get('hoverinfo', 'all')
+    if not isinstance(hoverinfo, str):
+        return set(DEFAULT_HOVER_KEYS)
+    if hoverinfo in ('none', 'skip'):
+        return set()
+    if hoverinfo == 'all':
+        return set(DEFAULT_HOVER_KEYS)
+    return set(hoverinfo.split('+'))
+
+
+def compact_trace(trace, geo=False, layout=None):
+    """Compact one trace dict in place.
+
+    Coordinates shown in the hover label keep the precision the label
+    displays, or their exact values if that cannot be determined.
+
+    Args:
+        trace (dict): Plotly trace from ``to_plotly_json()``
+        geo (bool): Whether the trace is drawn on a geographic map
+        layout (dict): Figure layout, for the axes' hover formats
+    """
+    for key in ('text', 'hovertext'):
+        value = _collapse_constant(trace.get(key))
+        if value is not None:
+            trace[key] = value
+    if 'hovertext' in trace and 'text' in trace and 'hovertext' not in str(trace.get('hovertemplate', '')) \
+            and _equal(trace['hovertext'], trace['text']):
+        del trace['hovertext']
+    _compact_customdata(trace)
+
+    shown = _hover_keys(trace)
+    for key in list(trace):
+        if key in COORDINATE_KEYS or key in EXACT_KEYS or key == 'customdata':
+            exact = key in shown
+            hover = _hover_decimals(trace, key, layout or {}) if exact else None
+            trace[key] = _compact_value(key, trace[key], geo=geo, exact=exact, hover=hover)
+    marker = trace.get('marker')
+    if isinstance(marker, dict):
+        for key in MARKER_KEYS & set(marker):
+            value = _collapse_constant(marker[key])
+            # A single numeric color would lose its colorscale mapping
+            if value is not None and (key != 'color' or isinstance(value, str)):
+                marker[key] = value
+            else:
+                marker[key] = _compact_value(key, marker[key])
+
+
+def _equal(a, b):
+    """Compare two attribute values that may be lists or arrays."""
+    try:
+        return bool(np.array_equal(np.asarray(a, dtype=object), np.asarray(b, dtype=object)))
+    except (ValueError, TypeError):
+        return False
+
+
+def compact_figure(fig_dict):
+    """Compact every trace of a figure dict, including animation frames.
+
+    Args:
+        fig_dict (dict): Figure from ``fig.to_plotly_json()``
+
+    Returns:
+        dict: The same dict, compacted in place
+    """
+    layout = fig_dict.get('layout') or {}
+    traces = list(fig_dict.get('data', []))
+    for frame in fig_dict.get('frames', []) or []:
+        traces.extend(frame.get('data', []) or [])
+    for trace in traces:
+        trace_type = trace.get('type', 'scatter')
+        compact_trace(trace, geo=trace_type in ('scattergeo', 'scattermapbox', 'scattermap',
+                                                'densitymapbox', 'densitymap'), layout=layout)
+    return fig_dict
+
+
+def encode_plotly_figure(fig):
+    """Serialize a Plotly figure to compact JSON bytes.
+
+    The compacted payload is only used when it is smaller than
+    ``fig.to_json()``, the serialization ``st.plotly_chart`` would send for
+    the figure itself. Results are cached by the hash of that
+    serialization.
+
+    Args:
+        fig (go.Figure): Figure to serialize
+
+    Returns:
+        bytes: UTF-8 JSON readable by ``load_plotly_payload`` and plotly.js
+    """
+    plain = fig.to_json().encode('utf-8')
+    key = hashlib.blake2b(plain, digest_size=16).digest()
+    with _encoded_cache_lock:
+        cached = _encoded_cache.get(key)
+        if cached is not None:
+            _encoded_cache.move_to_end(key)
+            return cached
+    compacted = pio.to_json(compact_figure(fig.to_plotly_json()), validate=False).encode('utf-8')
+    encoded = compacted if len(compacted) < len(plain) else plain
+    with _encoded_cache_lock:
+        _encoded_cache[key] = encoded
+        while len(_encoded_cache) > FIGURE_CACHE_MAX_ENTRIES:
+            _encoded_cache.popitem(last=False)
+    return encoded
+
+
+def load_plotly_payload(data):
+    """Parse figure JSON bytes, caching the result by content hash.
+
+    Args:
+        data (bytes): Figure JSON (compact or plain)
+
+    Returns:
+        dict: Figure dict for ``st.plotly_chart``; treat as read-only
+    """
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    with _payload_cache_lock:
+        cached = _payload_cache.get(key)
+        if cached is not None:
+            _payload_cache.move_to_end(key)
+            return cached
+    figure = json.loads(data)
+    with _payload_cache_lock:
+        _payload_cache[key] = figure
+        while len(_payload_cache) > FIGURE_CACHE_MAX_ENTRIES:
+            _payload_cache.popitem(last=False)
+    return figure
@@ -0,0 +1,151 @@
+"""Generate-and-render pipeline shared by the Streamlit app and the generation service.
+
+Nothing here draws Streamlit widgets, so the same code runs inside the UI
+script thread or in a render process of ``generation_service``.
+"""
+
+import contextlib
+import io
+import threading
+
+import matplotlib
+import matplotlib.pyplot as plt
+import pandas as pd
+import plotly.graph_objects as go
+
+from figure_optimizer import optimize_plotly_figure, save_matplotlib_figure
+from figure_transport import encode_plotly_figure
+from geocoding import describe_geocoded_columns, get_geocoded_columns, wants_map
+from llm_client import completion_cache_key, generate_code, take_completion
+from market_basket import describe_basket_tables, get_basket_tables, wants_basket_analysis
+from shared_dataset import isolated_view
+
+matplotlib.use('Agg')
+
+# pyplot keeps global figure state, so renders are serialized per process
+_render_lock = threading.Lock()
+
+
+def build_execution_context(df, fingerprint, prompt_to_use):
+    """Collect precomputed helper tables relevant to a request.
+
+    Args:
+        df (pd.DataFrame): Current dataset
+        fingerprint (str): Fingerprint of the current dataset
+        prompt_to_use (str): The user's visualization request
+
+    Returns:
+        tuple: (list of prompt notes, dict of extra variables for exec)
+    """
+    notes = []
+    extra_vars = {}
+    if wants_basket_analysis(prompt_to_use, df.columns):
+        basket_pairs, basket_items = get_basket_tables(fingerprint, df)
+        extra_vars['basket_pairs'] = basket_pairs
+        extra_vars['basket_items'] = basket_items
+        notes.append(describe_basket_tables(basket_pairs))
+    if wants_map(prompt_to_use, df.columns) and 'lat' not in df.columns:
+        coordinates = get_geocoded_columns(fingerprint, df)
+        # Executed code sees the coordinates as regular columns of 'df'
+        extra_vars['df'] = df.assign(**{column: coordinates[column] for column in coordinates.columns})
+        notes.append(describe_geocoded_columns(coordinates))
+    return notes, extra_vars
+
+
+def build_prompt_parts(df, fingerprint, prompt_to_use):
+    """Build the two parts of the LLM prompt for a request.
+
+    The stable dataset context comes first (cacheable by providers), the
+    per-request ask last.
+
+    Args:
+        df (pd.DataFrame): Current dataset
+        fingerprint (str): Fingerprint of the current dataset
+        prompt_to_use (str): The user's visualization request
+
+    Returns:
+        tuple: (dataset_context, request_prompt)
+    """
+    columns_str = ", ".join(df.columns)
+    df_head_str = df.head().to_string(index=False)
+    dataset_context = f"""DataFrame 'df' has columns: {columns_str}
+Sample data:
+{df_head_str}"""
+    context_notes, _ = build_execution_context(df, fingerprint, prompt_to_use)
+    context_str = "".join(f"{note}\n\n" for note in context_notes)
+    request_prompt = f"{context_str}Create a Python visualization for this request: {prompt_to_use}"
+    return dataset_context, request_prompt
+
+
+def iter_generations(models, dataset_context, request_prompt, prompt_to_use, complexity=None, owner=None):
+    """Generate code with every model, yielding each result as it completes.
+
+    Prefetched results are used once; a speculation still in flight is
+    joined through request coalescing.
+
+    Args:
+        models (dict): Model name to OpenRouter model id
+        dataset_context (str): Dataset columns and sample rows
+        request_prompt (str): Request-specific part of the prompt
+        prompt_to_use (str): The visualization request
+        complexity (str, optional): Problem complexity
+        owner (str, optional): Session whose prefetched results may be used
+
+    Yields:
+        tuple: (model_name, result dict, whether it was prefetched)
+    """
+    for model_name, model_id in models.items():
+        prefetched = take_completion(
+            completion_cache_key(model_id, dataset_context, request_prompt, complexity, owner)
+        )
+        if prefetched:
+            yield model_name, prefetched, True
+            continue
+        result = generate_code(
+            model_name, model_id, dataset_context, request_prompt, prompt_to_use,
+            complexity=complexity
+        )
+        yield model_name, result, False
+
+
+def run_code(code, df, extra_vars=None, profiler=None):
+    """Execute generated visualization code and serialize the figure.
+
+    Args:
+        code (str): Generated Python code
+        df (pd.DataFrame): Shared dataset; the code gets an isolated view as 'df'
+        extra_vars (dict, optional): Precomputed tables exposed to the code
+        profiler (ExecutionProfiler, optional): Profiles execution and figure
+            serialization, excluding the wait for the render lock
+
+    Returns:
+        tuple: (kind, bytes) of the rendered figure ('plotly_json' or 'png')
+
+    Raises:
+        Exception: Whatever the generated code raised
+    """
+    exec_code = code.replace("plt.show()", "").replace("fig.show()", "")
+    with _render_lock:
+        try:
+            plt.figure()
+            global_vars = {
+                'plt': plt,
+                'pd': pd,
+                'df': df,
+                'go': go
+            }
+            global_vars.update(extra_vars or {})
+            # In-place edits by one model must not leak into the next
+            global_vars['df'] = isolated_view(global_vars['df'])
+
+            with profiler or contextlib.nullcontext():
+                exec(exec_code, global_vars, global_vars)
+
+                if 'fig' in global_vars and isinstance(global_vars['fig'], go.Figure):
+                    fig = optimize_plotly_figure(global_vars['fig'])
+                    return 'plotly_json', encode_plotly_figure(fig)
+                buffer = io.BytesIO()
+                save_matplotlib_figure(plt.gcf(), buffer, format='png', bbox_inches='tight')
+                return 'png', buffer.getvalue()
+        finally:
+            plt.close('all')
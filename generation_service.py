@@ -0,0 +1,575 @@
+"""Standalone generation service with a job queue.
+
+Runs LLM generation and code rendering outside the Streamlit servers, so UI
+replicas and generation workers can be scaled separately on one machine.
+Worker threads wait on the LLM calls; generated code is executed and
+rendered in a pool of worker processes, each holding the datasets it has
+used, so CPU-bound rendering scales with the number of processes.
+The API is plain HTTP/JSON served by the standard library:
+
+    GET  /health                  worker and queue status
+    HEAD /datasets/<fingerprint>  200 if the dataset is held, else 404
+    PUT  /datasets/<fingerprint>  upload a dataset as CSV
+    POST /jobs                    queue a generation job, returns its id
+    GET  /jobs/<id>?since=V&wait=S
+                                  job status and the results added after
+                                  version V; waits up to S seconds for a
+                                  version newer than V
+
+Run with:
+    python generation_service.py --port 8710 --workers 4 --render-processes 4
+
+and point the app at it with GENERATION_SERVICE_URL=http://127.0.0.1:8710.
+"""
+
+import argparse
+import atexit
+import base64
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import requests
+
+from config import (
+    GENERATION_JOB_RETENTION,
+    GENERATION_JOB_TTL,
+    GENERATION_MAX_BODY_BYTES,
+    GENERATION_MAX_DATASETS,
+    GENERATION_POLL_TIMEOUT,
+    GENERATION_QUEUE_SIZE,
+    GENERATION_RENDER_PROCESSES,
+    GENERATION_WORKERS,
+)
+from generation import build_execution_context, iter_generations, run_code
+from profiling import ExecutionProfiler
+
+# Longest a single status request may wait for changes
+MAX_WAIT_SECONDS = 30
+
+# How often expired jobs are dropped
+EXPIRY_INTERVAL_SECONDS = 60
+
+# Datasets loaded by this render process, keyed by fingerprint (LRU)
+_process_datasets = OrderedDict()
+
+
+class JobStore:
+    """In-memory job records with bounded retention.
+
+    Every change bumps the job's version and wakes waiting pollers. Each
+    result remembers the version that added it, so pollers only receive
+    results they do not have yet.
+    """
+
+    def __init__(self, retention=GENERATION_JOB_RETENTION, ttl=GENERATION_JOB_TTL):
+        self.retention = retention
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+
+    def create(self, request):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._changed:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'version': 0,
+                'created_at': now,
+                'updated_at': now,
+                'models': list(request['models']),
+                'results': {},
+                'result_versions': {},
+                'error': None,
+                'request': request,
+            }
+            self._expire(now)
+        return job_id
+
+    def update(self, job_id, **changes):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(changes)
+            job['version'] += 1
+            job['updated_at'] = time.time()
+            self._changed.notify_all()
+
+    def add_result(self, job_id, model_name, result):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['results'][model_name] = result
+            job['version'] += 1
+            job['result_versions'][model_name] = job['version']
+            job['updated_at'] = time.time()
+            self._changed.notify_all()
+
+    def get(self, job_id, since=None, wait=0.0):
+        """Return a public snapshot of a job.
+
+        Args:
+            job_id (str): Job id
+            since (int, optional): Version the caller already has; only
+                results added after it are included
+            wait (float): Seconds to wait for a newer version
+
+        Returns:
+            dict: Job snapshot, or None if unknown or expired
+        """
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if since is None or job['version'] > since or job['status'] in ('done', 'failed') or remaining <= 0:
+                    snapshot = {
+                        key: value for key, value in job.items() if key not in ('request', 'result_versions')
+                    }
+                    snapshot['results'] = {
+                        model_name: result for model_name, result in job['results'].items()
+                        if since is None or job['result_versions'][model_name] > since
+                    }
+                    return snapshot
+                self._changed.wait(remaining)
+
+    def queued_count(self):
+        with self._changed:
+            return sum(1 for job in self._jobs.values() if job['status'] == 'queued')
+
+    def expire(self):
+        """Drop expired jobs; called periodically so idle services shrink too."""
+        with self._changed:
+            self._expire(time.time())
+
+    def _expire(self, now):
+        """Drop expired jobs and the oldest finished ones beyond retention."""
+        for job_id in [j for j, job in self._jobs.items() if now - job['updated_at'] > self.ttl]:
+            del self._jobs[job_id]
+        finished = [j for j, job in self._jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(self._jobs) - self.retention)]:
+            del self._jobs[job_id]
+
+
+class DatasetStore:
+    """Datasets uploaded by clients, keyed by fingerprint (LRU).
+
+    Datasets are kept as pickle files so render processes can load each one
+    once instead of receiving it with every task.
+    """
+
+    def __init__(self, max_entries=GENERATION_MAX_DATASETS, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory or tempfile.mkdtemp(prefix='promptvix-datasets-')
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, fingerprint, df):
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.pkl")
+        df.to_pickle(path)
+        evicted = []
+        with self._lock:
+            if fingerprint in self._paths:
+                evicted.append(self._paths[fingerprint])
+            self._paths[fingerprint] = path
+            self._paths.move_to_end(fingerprint)
+            while len(self._paths) > self.max_entries:
+                evicted.append(self._paths.popitem(last=False)[1])
+        for old_path in evicted:
+            with contextlib.suppress(OSError):
+                os.remove(old_path)
+
+    def get(self, fingerprint):
+        """Return the dataset's pickle path, or None if it is not held."""
+        with self._lock:
+            path = self._paths.get(fingerprint)
+            if path is not None:
+                self._paths.move_to_end(fingerprint)
+            return path
+
+    def close(self):
+        """Delete all stored dataset files."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _load_process_dataset(fingerprint, path):
+    """Return a dataset in this render process, loading it on first use."""
+    df = _process_datasets.get(fingerprint)
+    if df is None:
+        df = pd.read_pickle(path)
+        _process_datasets[fingerprint] = df
+        while len(_process_datasets) > GENERATION_MAX_DATASETS:
+            _process_datasets.popitem(last=False)
+    else:
+        _process_datasets.move_to_end(fingerprint)
+    return df
+
+
+def render_task(fingerprint, path, code, prompt_to_use, profile):
+    """Execute and render generated code inside a render process.
+
+    Args:
+        fingerprint (str): Dataset fingerprint
+        path (str): Pickle file of the dataset
+        code (str): Generated Python code
+        prompt_to_use (str): The visualization request (selects helper tables)
+        profile (bool): Profile the execution
+
+    Returns:
+        tuple: (artifact or None, error message or None, profile summary or None)
+    """
+    df = _load_process_dataset(fingerprint, path)
+    _, extra_vars = build_execution_context(df, fingerprint, prompt_to_use)
+    profiler = ExecutionProfiler() if profile else None
+    try:
+        artifact, error = run_code(code, df, extra_vars, profiler), None
+    except Exception as e:
+        # Exceptions from generated code may not be picklable
+        artifact, error = None, str(e)
+    return artifact, error, profiler.summary if profiler is not None else None
+
+
+def encode_artifact(artifact):
+    """Encode a (kind, bytes) figure for JSON transport."""
+    kind, data = artifact
+    return {'kind': kind, 'data': base64.b64encode(data).decode('ascii')}
+
+
+def decode_artifact(encoded):
+    """Decode a figure produced by ``encode_artifact``."""
+    return encoded['kind'], base64.b64decode(encoded['data'])
+
+
+def run_job(jobs, datasets, renderer, job_id, request):
+    """Generate with every model and render each successful result.
+
+    Args:
+        jobs (JobStore): Job records
+        datasets (DatasetStore): Uploaded datasets
+        renderer (ProcessPoolExecutor): Render processes
+        job_id (str): Job to run
+        request (dict): Job request as posted by the client
+    """
+    jobs.update(job_id, status='running')
+    try:
+        fingerprint = request.get('fingerprint')
+        path = datasets.get(fingerprint) if request.get('render', True) else None
+
+        for model_name, result, _ in iter_generations(
+            request['models'], request['dataset_context'], request['request_prompt'],
+            request['prompt_to_use'], request.get('complexity')
+        ):
+            result = dict(result)
+            if path is not None and result['success']:
+                try:
+                    artifact, error, profile = renderer.submit(
+                        render_task, fingerprint, path, result['code'],
+                        request['prompt_to_use'], bool(request.get('profile'))
+                    ).result()
+                except Exception as e:
+                    artifact, error, profile = None, f"render process failed: {e}", None
+                if artifact is not None:
+                    result['artifact'] = encode_artifact(artifact)
+                else:
+                    result['render_error'] = error
+                result['artifact_fingerprint'] = fingerprint
+                if profile is not None:
+                    result['profile'] = profile
+            jobs.add_result(job_id, model_name, result)
+        jobs.update(job_id, status='done')
+    except Exception as e:
+        jobs.update(job_id, status='failed', error=str(e))
+
+
+def make_handler(jobs, datasets, job_queue, workers, render_processes=GENERATION_RENDER_PROCESSES):
+    """Build the request handler class for the service.
+
+    Args:
+        jobs (JobStore): Job records
+        datasets (DatasetStore): Uploaded datasets
+        job_queue (queue.Queue): Pending job ids
+        workers (int): Number of worker threads (reported by /health)
+        render_processes (int): Number of render processes (reported by /health)
+
+    Returns:
+        type: BaseHTTPRequestHandler subclass
+    """
+
+    class GenerationHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body=None):
+            data = json.dumps(body).encode('utf-8') if body is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        def _read_body(self):
+            """Read the request body, or answer 400/413 and return None."""
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                length = -1
+            if length < 0 or length > GENERATION_MAX_BODY_BYTES:
+                # The body is left unread, so the connection cannot be reused
+                self.close_connection = True
+                if length < 0:
+                    self._send_json(400, {'error': 'invalid Content-Length'})
+                else:
+                    self._send_json(413, {'error': f'body exceeds {GENERATION_MAX_BODY_BYTES} bytes'})
+                return None
+            return self.rfile.read(length) if length else b''
+
+        def _route(self):
+            parsed = urlparse(self.path)
+            return parsed.path.strip('/').split('/'), parse_qs(parsed.query)
+
+        def do_HEAD(self):
+            parts, _ = self._route()
+            if len(parts) == 2 and parts[0] == 'datasets':
+                self._send_json(200 if datasets.get(parts[1]) is not None else 404)
+            else:
+                self._send_json(404)
+
+        def do_GET(self):
+            parts, query = self._route()
+            if parts == ['health']:
+                self._send_json(200, {
+                    'status': 'ok',
+                    'workers': workers,
+                    'render_processes': render_processes,
+                    'queued': jobs.queued_count(),
+                })
+            elif len(parts) == 2 and parts[0] == 'jobs':
+                try:
+                    since = int(query['since'][0]) if 'since' in query else None
+                    wait = min(float(query.get('wait', ['0'])[0]), MAX_WAIT_SECONDS)
+                except ValueError:
+                    self._send_json(400, {'error': 'invalid since/wait'})
+                    return
+                job = jobs.get(parts[1], since=since, wait=wait)
+                if job is None:
+                    self._send_json(404, {'error': 'unknown job'})
+                else:
+                    self._send_json(200, job)
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_PUT(self):
+            parts, _ = self._route()
+            if len(parts) != 2 or parts[0] != 'datasets':
+                self._send_json(404, {'error': 'not found'})
+                return
+            body = self._read_body()
+            if body is None:
+                return
+            try:
+                df = pd.read_csv(io.BytesIO(body))
+            except Exception as e:
+                self._send_json(400, {'error': f'invalid CSV: {e}'})
+                return
+            datasets.put(parts[1], df)
+            self._send_json(201, {'fingerprint': parts[1], 'rows': len(df)})
+
+        def do_POST(self):
+            parts, _ = self._route()
+            if parts != ['jobs']:
+                self._send_json(404, {'error': 'not found'})
+                return
+            body = self._read_body()
+            if body is None:
+                return
+            try:
+                request = json.loads(body or b'{}')
+                missing = [key for key in ('models', 'dataset_context', 'request_prompt', 'prompt_to_use')
+                           if not request.get(key)]
+            except ValueError:
+                request, missing = None, ['valid JSON body']
+            if missing:
+                self._send_json(400, {'error': f"missing {', '.join(missing)}"})
+                return
+            job_id = jobs.create(request)
+            try:
+                job_queue.put_nowait((job_id, request))
+            except queue.Full:
+                jobs.update(job_id, status='failed', error='queue full')
+                self._send_json(503, {'error': 'queue full', 'job_id': job_id})
+                return
+            self._send_json(202, {'job_id': job_id, 'status': 'queued'})
+
+    return GenerationHandler
+
+
+def start_service(port=0, workers=GENERATION_WORKERS, host='127.0.0.1', queue_size=GENERATION_QUEUE_SIZE,
+                  render_processes=GENERATION_RENDER_PROCESSES):
+    """Start the service, its worker threads and its render processes.
+
+    Args:
+        port (int): Port to listen on (0 = any free port)
+        workers (int): Number of worker threads running jobs (LLM calls)
+        host (str): Interface to bind
+        queue_size (int): Maximum number of queued jobs
+        render_processes (int): Number of processes executing generated code
+
+    Returns:
+        tuple: (service base URL, server)
+    """
+    jobs = JobStore()
+    datasets = DatasetStore()
+    atexit.register(datasets.close)
+    job_queue = queue.Queue(maxsize=queue_size)
+    # Spawned, not forked: the parent already runs threads holding locks
+    renderer = ProcessPoolExecutor(
+        max_workers=render_processes, mp_context=multiprocessing.get_context('spawn')
+    )
+
+    def worker():
+        while True:
+            job_id, request = job_queue.get()
+            try:
+                run_job(jobs, datasets, renderer, job_id, request)
+            finally:
+                job_queue.task_done()
+
+    def expire_jobs():
+        while True:
+            time.sleep(EXPIRY_INTERVAL_SECONDS)
+            jobs.expire()
+
+    for _ in range(workers):
+        threading.Thread(target=worker, daemon=True).start()
+    threading.Thread(target=expire_jobs, daemon=True).start()
+
+    server = ThreadingHTTPServer(
+        (host, port), make_handler(jobs, datasets, job_queue, workers, render_processes)
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{host}:{server.server_address[1]}", server
+
+
+class GenerationServiceClient:
+    """Thin client used by the Streamlit app when a service URL is configured."""
+
+    def __init__(self, base_url, timeout=GENERATION_POLL_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def ensure_dataset(self, fingerprint, df):
+        """Upload the dataset unless the service already holds it."""
+        url = f"{self.base_url}/datasets/{fingerprint}"
+        if self.session.head(url, timeout=10).status_code == 200:
+            return
+        response = self.session.put(
+            url, data=df.to_csv(index=False).encode('utf-8'),
+            headers={'Content-Type': 'text/csv'}, timeout=120
+        )
+        response.raise_for_status()
+
+    def submit(self, models, dataset_context, request_prompt, prompt_to_use, complexity=None,
+               fingerprint=None, profile=False):
+        """Queue a generation job.
+
+        Returns:
+            str: Job id
+        """
+        response = self.session.post(f"{self.base_url}/jobs", json={
+            'models': models,
+            'dataset_context': dataset_context,
+            'request_prompt': request_prompt,
+            'prompt_to_use': prompt_to_use,
+            'complexity': complexity,
+            'fingerprint': fingerprint,
+            'render': fingerprint is not None,
+            'profile': profile,
+        }, timeout=10)
+        response.raise_for_status()
+        return response.json()['job_id']
+
+    def iter_results(self, job_id, wait=10):
+        """Yield model results as the service reports them.
+
+        Args:
+            job_id (str): Job id from ``submit``
+            wait (float): Long-poll interval in seconds
+
+        Yields:
+            tuple: (model_name, result dict with any artifact decoded)
+
+        Raises:
+            RuntimeError: If the job failed, expired or timed out
+        """
+        seen = set()
+        version = None
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            params = {'wait': wait} if version is None else {'since': version, 'wait': wait}
+            response = self.session.get(f"{self.base_url}/jobs/{job_id}", params=params, timeout=wait + 10)
+            if response.status_code == 404:
+                raise RuntimeError("Generation job expired on the service")
+            response.raise_for_status()
+            job = response.json()
+            version = job['version']
+            for model_name, result in job['results'].items():
+                if model_name in seen:
+                    continue
+                seen.add(model_name)
+                if result.get('artifact'):
+                    result['artifact'] = decode_artifact(result['artifact'])
+                yield model_name, result
+            if job['status'] == 'failed':
+                raise RuntimeError(job['error'] or "Generation job failed")
+            if job['status'] == 'done':
+                return
+        raise RuntimeError("Timed out waiting for the generation service")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PromptVix generation service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8710)
+    parser.add_argument('--workers', type=int, default=GENERATION_WORKERS)
+    parser.add_argument('--queue-size', type=int, default=GENERATION_QUEUE_SIZE)
+    parser.add_argument('--render-processes', type=int, default=GENERATION_RENDER_PROCESSES)
+    args = parser.parse_args()
+
+    url, _ = start_service(
+        args.port, args.workers, host=args.host, queue_size=args.queue_size,
+        render_processes=args.render_processes
+    )
+    print(f"GENERATION_SERVICE_URL={url} ({args.workers} workers, "
+          f"{args.render_processes} render processes)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
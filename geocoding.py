@@ -0,0 +1,143 @@
+"""Offline geocoding of City/State/Postal Code columns for map problems."""
+
+import functools
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config import GEOCODE_CITY_PATH, GEOCODE_POSTAL_PATH, GEOCODE_STATE_PATH
+
+CITY_COLUMN = 'City'
+STATE_COLUMN = 'State'
+POSTAL_COLUMN = 'Postal Code'
+
+MAP_PATTERN = re.compile(r"\bmaps?\b|geograph|choropleth|scatter_geo|mapbox", re.IGNORECASE)
+
+
+def wants_map(prompt, columns):
+    """Check whether a prompt asks for a map on a dataset with locations.
+
+    Args:
+        prompt (str): Visualization request
+        columns (iterable): Columns of the current dataset
+
+    Returns:
+        bool: True if coordinates should be joined for this request
+    """
+    columns = set(columns)
+    if STATE_COLUMN not in columns or (CITY_COLUMN not in columns and POSTAL_COLUMN not in columns):
+        return False
+    return bool(MAP_PATTERN.search(prompt or ""))
+
+
+def _normalize(values):
+    """Normalize place names for matching (case and surrounding spaces)."""
+    return values.astype(str).str.strip().str.lower()
+
+
+@functools.lru_cache(maxsize=1)
+def load_lookup_tables():
+    """Load the bundled coordinate tables on first use.
+
+    Returns:
+        tuple: (cities, postal, states) DataFrames with 'lat' and 'lon',
+            indexed by "city|state", 5-digit postal code and state name
+    """
+    cities = pd.read_csv(GEOCODE_CITY_PATH)
+    cities.index = _normalize(cities['city']) + '|' + _normalize(cities['state'])
+    cities = cities[~cities.index.duplicated()][['lat', 'lon']]
+
+    states = pd.read_csv(GEOCODE_STATE_PATH)
+    states.index = _normalize(states['state'])
+    states = states[['lat', 'lon']]
+
+    if GEOCODE_POSTAL_PATH and os.path.exists(GEOCODE_POSTAL_PATH):
+        postal = pd.read_csv(GEOCODE_POSTAL_PATH, dtype={'postal_code': str})
+        postal.index = postal['postal_code'].str.zfill(5)
+        postal = postal[~postal.index.duplicated()][['lat', 'lon']]
+    else:
+        postal = pd.DataFrame(columns=['lat', 'lon'], dtype=float)
+
+    return cities, postal, states
+
+
+def geocode_locations(df):
+    """Join offline coordinates onto a dataset's location columns.
+
+    Each distinct location is resolved once, by (City, State) first, then by
+    Postal Code, then by the state centroid, and the result is mapped back
+    onto every row without any per-row Python work.
+
+    Args:
+        df (pd.DataFrame): Dataset with City/State and/or Postal Code columns
+
+    Returns:
+        pd.DataFrame: 'lat', 'lon' and 'geo_precision' ('city', 'postal',
+            'state' or missing) aligned to ``df.index``
+    """
+    cities, postal, states = load_lookup_tables()
+    columns = [c for c in (CITY_COLUMN, STATE_COLUMN, POSTAL_COLUMN) if c in df.columns]
+    locations = df[columns].drop_duplicates()
+
+    lat = pd.Series(np.nan, index=locations.index)
+    lon = pd.Series(np.nan, index=locations.index)
+    precision = pd.Series(None, index=locations.index, dtype=object)
+
+    def _fill(keys, table, label):
+        missing = lat.isna()
+        found = keys[missing].map(table['lat'])
+        hit = found.index[found.notna()]
+        lat[hit] = found[hit]
+        lon[hit] = keys[hit].map(table['lon'])
+        precision[hit] = label
+
+    state_keys = _normalize(locations[STATE_COLUMN])
+    if CITY_COLUMN in columns:
+        _fill(_normalize(locations[CITY_COLUMN]) + '|' + state_keys, cities, 'city')
+    if POSTAL_COLUMN in columns and len(postal):
+        postal_keys = pd.to_numeric(locations[POSTAL_COLUMN], errors='coerce')
+        postal_keys = postal_keys.astype('Int64').astype(str).str.zfill(5)
+        _fill(postal_keys, postal, 'postal')
+    _fill(state_keys, states, 'state')
+
+    resolved = pd.DataFrame({'lat': lat, 'lon': lon, 'geo_precision': precision})
+    resolved = pd.concat([locations, resolved], axis=1)
+    joined = df[columns].merge(resolved, on=columns, how='left')
+    joined.index = df.index
+    return joined[['lat', 'lon', 'geo_precision']]
+
+
+@st.cache_data(show_spinner="Geocoding locations...", max_entries=8)
+def get_geocoded_columns(fingerprint, _df):
+    """Return cached coordinate columns for a dataset fingerprint.
+
+    Args:
+        fingerprint (str): Dataset fingerprint (cache key)
+        _df (pd.DataFrame): Dataset; excluded from Streamlit's hashing
+
+    Returns:
+        pd.DataFrame: 'lat', 'lon' and 'geo_precision' aligned to the dataset
+    """
+    return geocode_locations(_df)
+
+
+def describe_geocoded_columns(coordinates):
+    """Describe the joined coordinates for inclusion in the LLM prompt.
+
+    Args:
+        coordinates (pd.DataFrame): Columns returned by ``geocode_locations``
+
+    Returns:
+        str: Prompt section explaining the available columns
+    """
+    coverage = coordinates['geo_precision'].value_counts(normalize=True)
+    coverage_str = ", ".join(f"{label} {share:.0%}" for label, share in coverage.items())
+    return (
+        "DataFrame 'df' also has ready-made 'lat' and 'lon' columns (offline lookup; "
+        f"'geo_precision' gives the match level: {coverage_str}). "
+        "Use them directly for maps (e.g. plotly scatter_geo with scope='usa'); "
+        "do not call geocoding services or download map data."
+    )
@@ -0,0 +1,466 @@
+"""OpenRouter client with process-wide coalescing of identical requests."""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from config import (
+    COMPLETION_CACHE_MAX_ENTRIES,
+    COMPLETION_CACHE_TTL,
+    MAX_CONTINUATIONS,
+    OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
+    TEMPERATURE,
+)
+from token_budget import get_token_budget, record_completion_tokens
+
+SYSTEM_INSTRUCTION = (
+    "You are a Python code generator. "
+    "Return only executable Python code in a single ```python code block, "
+    "starting your reply with the opening fence, no explanations.\n\n"
+    "Requirements:\n"
+    "- Use matplotlib, seaborn, or plotly\n"
+    "- Include plt.show() or fig.show()\n"
+    "- Return only Python code\n"
+    "- Use pandas for data manipulation"
+)
+
+# Marks the end of the stable prompt prefix for providers with explicit caching
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# End generation at the closing code fence so no trailing prose is decoded.
+# Replies start with the opening fence, which has no newline before it, so
+# only the closing fence matches.
+STOP_SEQUENCES = ["\n```"]
+
+# First fenced code block of a reply; an unclosed block runs to the end
+CODE_BLOCK = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)(?:\n[ \t]*```|\Z)", re.DOTALL | re.IGNORECASE)
+
+CONTINUE_INSTRUCTION = (
+    "Your previous answer was cut off. Continue the code exactly where it "
+    "stopped. Do not repeat earlier lines and do not add explanations."
+)
+
+
+class _InFlightCall:
+    """A single upstream request that concurrent identical callers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+# Process-wide registry shared by every Streamlit session thread
+_inflight = {}
+_inflight_lock = threading.Lock()
+_stats = {
+    'upstream_calls': 0,
+    'coalesced_calls': 0,
+}
+
+# Prefetched generations waiting to be used, keyed by completion_cache_key
+_completion_cache = OrderedDict()
+_completion_cache_lock = threading.Lock()
+
+# Prompt cache usage per model id, accumulated from response 'usage'
+_cache_stats = {}
+_cache_stats_lock = threading.Lock()
+
+
+def _request_key(payload):
+    """Build the coalescing key for a completion payload.
+
+    The key covers the model id, the full message list and every sampling
+    parameter, so only truly identical requests share an upstream call.
+
+    Args:
+        payload (dict): JSON payload for the chat completions endpoint
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _post_completion(payload):
+    """Send a chat completion request to OpenRouter.
+
+    Args:
+        payload (dict): JSON payload for the chat completions endpoint
+
+    Returns:
+        requests.Response: Raw HTTP response
+    """
+    url = f"{OPENROUTER_BASE_URL}/chat/completions"
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/ra90x/PromptVix",
+        "X-Title": "PromptVix"
+    }
+    return requests.post(url, headers=headers, json=payload)
+
+
+def request_completion(payload):
+    """Send a completion request, sharing it with identical in-flight ones.
+
+    The first caller for a given key performs the upstream call; callers
+    that arrive while it is running wait for it and receive the same
+    response (or exception) instead of issuing their own request.
+
+    Args:
+        payload (dict): JSON payload for the chat completions endpoint
+
+    Returns:
+        requests.Response: Response shared by all coalesced callers
+    """
+    return _coalesced_request(payload)[0]
+
+
+def _coalesced_request(payload):
+    """Run ``request_completion`` and report whether this caller sent the request.
+
+    Returns:
+        tuple: (requests.Response, True if this caller made the upstream call)
+    """
+    key = _request_key(payload)
+    with _inflight_lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _InFlightCall()
+            _inflight[key] = call
+            _stats['upstream_calls'] += 1
+        else:
+            _stats['coalesced_calls'] += 1
+
+    if not is_leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.response, False
+
+    try:
+        call.response = _post_completion(payload)
+        return call.response, True
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
+
+def get_coalescing_stats():
+    """Return counters for upstream and coalesced completion calls.
+
+    Returns:
+        dict: Snapshot with 'upstream_calls', 'coalesced_calls' and 'in_flight'
+    """
+    with _inflight_lock:
+        stats = dict(_stats)
+        stats['in_flight'] = len(_inflight)
+    return stats
+
+
+def completion_cache_key(model_id, dataset_context, request_prompt, complexity=None, owner=None):
+    """Build the completion cache key for a generate_code call.
+
+    Args:
+        model_id (str): OpenRouter model identifier
+        dataset_context (str): Dataset columns and sample rows
+        request_prompt (str): Request-specific part of the prompt
+        complexity (str, optional): Problem complexity
+        owner (str, optional): Session the entry belongs to; entries are
+            only visible to the session that prefetched them
+
+    Returns:
+        str: Hex digest identifying the generation inputs
+    """
+    return _request_key([owner, model_id, dataset_context, request_prompt, complexity, TEMPERATURE])
+
+
+def store_completion(key, result):
+    """Keep a prefetched successful result until it is used or expires.
+
+    Args:
+        key (str): Key from ``completion_cache_key``
+        result (dict): Result returned by ``generate_code``
+    """
+    if not result.get('success'):
+        return
+    with _completion_cache_lock:
+        _completion_cache[key] = (time.monotonic(), result)
+        _completion_cache.move_to_end(key)
+        while len(_completion_cache) > COMPLETION_CACHE_MAX_ENTRIES:
+            _completion_cache.popitem(last=False)
+
+
+def take_completion(key):
+    """Remove and return a prefetched result.
+
+    Entries are handed out once so that an explicit Generate click still
+    produces fresh output on later clicks.
+
+    Args:
+        key (str): Key from ``completion_cache_key``
+
+    Returns:
+        dict: Cached result, or None if missing or expired
+    """
+    with _completion_cache_lock:
+        entry = _completion_cache.pop(key, None)
+    if entry is None or time.monotonic() - entry[0] > COMPLETION_CACHE_TTL:
+        return None
+    return entry[1]
+
+
+def discard_completion(key):
+    """Drop a prefetched result that is no longer wanted."""
+    with _completion_cache_lock:
+        _completion_cache.pop(key, None)
+
+
+def build_messages(dataset_context, request_prompt):
+    """Build chat messages with the stable context first and the ask last.
+
+    The system instruction (including library requirements) and the dataset
+    schema/sample are identical across requests on the same dataset, so they
+    form a fixed prefix that providers can serve from their prompt cache.
+    The prefix ends with a cache_control breakpoint; the per-request text
+    follows it.
+
+    Args:
+        dataset_context (str): Dataset columns and sample rows
+        request_prompt (str): Request-specific text (helper tables and the ask)
+
+    Returns:
+        list: Messages for the chat completions endpoint
+    """
+    return [
+        {"role": "system", "content": SYSTEM_INSTRUCTION},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": dataset_context, "cache_control": CACHE_CONTROL},
+                {"type": "text", "text": request_prompt}
+            ]
+        }
+    ]
+
+
+def _usage_tokens(usage):
+    """Return (prompt tokens, cached prompt tokens) from a response's usage."""
+    prompt_tokens = usage.get('prompt_tokens') or 0
+    cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+    return prompt_tokens, cached_tokens
+
+
+def _record_cache_usage(model_id, usage):
+    """Accumulate prompt and cached token counts from an upstream response."""
+    prompt_tokens, cached_tokens = _usage_tokens(usage)
+    with _cache_stats_lock:
+        stats = _cache_stats.setdefault(
+            model_id, {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+        )
+        stats['requests'] += 1
+        stats['prompt_tokens'] += prompt_tokens
+        stats['cached_tokens'] += cached_tokens
+    return prompt_tokens, cached_tokens
+
+
+def get_prompt_cache_stats():
+    """Return prompt cache usage per model id.
+
+    Returns:
+        dict: Model id to 'requests', 'prompt_tokens', 'cached_tokens' and
+            'hit_rate' (share of prompt tokens served from cache)
+    """
+    with _cache_stats_lock:
+        snapshot = {model_id: dict(stats) for model_id, stats in _cache_stats.items()}
+    for stats in snapshot.values():
+        stats['hit_rate'] = (
+            stats['cached_tokens'] / stats['prompt_tokens'] if stats['prompt_tokens'] else 0.0
+        )
+    return snapshot
+
+
+def clean_code(code):
+    """Extract the code from a model response.
+
+    Prose before the first code fence and anything after its closing fence
+    is dropped; a response without fences is taken as bare code.
+
+    Args:
+        code (str): Raw message content returned by the model
+
+    Returns:
+        str: Bare Python code
+    """
+    match = CODE_BLOCK.search(code)
+    if match:
+        return match.group(1).strip()
+    return code.strip()
+
+
+def _stopped_at_opening_fence(content):
+    """Tell whether a stop sequence likely cut a reply at its opening fence.
+
+    That happens when a model ignores the instruction and writes a blank
+    line or prose before the code block: the reply then is empty or holds
+    only that prose, which is neither fenced code, a diff nor valid Python.
+    """
+    if not content.strip():
+        return True
+    if '```' in content or re.search(r"^@@", content, flags=re.MULTILINE):
+        return False
+    try:
+        compile(content, '<reply>', 'exec')
+    except SyntaxError:
+        return True
+    return False
+
+
+def error_result(message, model_id, prompt_to_use):
+    """Build the result dict for a failed generation."""
+    return {
+        'code': message,
+        'model_id': model_id,
+        'success': False,
+        'prompt': prompt_to_use
+    }
+
+
+def complete_with_continuations(model_name, model_id, messages, max_tokens):
+    """Request a completion, continuing it while it is cut off.
+
+    Generation stops at the closing code fence, and a response cut off at
+    ``finish_reason=length`` is continued (up to ``MAX_CONTINUATIONS``
+    times) rather than returned truncated. A reply that stopped at its
+    opening fence after a line of prose is requested once more without
+    the stop sequence.
+
+    Args:
+        model_name (str): Display name of the model
+        model_id (str): OpenRouter model identifier
+        messages (list): Chat messages; the first two form the cacheable prefix
+        max_tokens (int): Token budget per request
+
+    Returns:
+        tuple: (content, usage dict with 'prompt_tokens', 'cached_tokens' and
+            'completion_tokens', error message or None)
+    """
+    content = ""
+    usage_total = {'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0}
+    base_messages = messages
+    stop = STOP_SEQUENCES
+    attempt = 0
+
+    while True:
+        payload = {
+            "model": model_id,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": TEMPERATURE,
+            "usage": {"include": True}
+        }
+        if stop:
+            payload["stop"] = stop
+        response, is_leader = _coalesced_request(payload)
+
+        if response.status_code != 200:
+            # Include brief response body for debugging
+            body_snippet = response.text[:300] if response.text else ""
+            return content, usage_total, f"API Error: {response.status_code} - {body_snippet}"
+
+        response_data = response.json()
+        if not response_data.get('choices'):
+            return content, usage_total, f"Error: {model_name} returned no choices"
+
+        choice = response_data['choices'][0]
+        chunk = choice['message'].get('content') or ""
+        usage = response_data.get('usage') or {}
+        usage_total['completion_tokens'] += usage.get('completion_tokens', 0)
+        # Coalesced followers share the leader's response; count it once
+        if is_leader:
+            request_prompt_tokens, request_cached_tokens = _record_cache_usage(model_id, usage)
+        else:
+            request_prompt_tokens, request_cached_tokens = _usage_tokens(usage)
+        usage_total['prompt_tokens'] += request_prompt_tokens
+        usage_total['cached_tokens'] += request_cached_tokens
+
+        if attempt == 0 and stop and choice.get('finish_reason') == 'stop' \
+                and _stopped_at_opening_fence(chunk):
+            # Prose came first and the stop hit the opening fence; ask again without it
+            stop = None
+            continue
+        if attempt > 0:
+            # Continuations sometimes reopen the code fence
+            chunk = re.sub(r"^\s*```(?:python|diff)?[ \t]*\n", "", chunk, flags=re.IGNORECASE)
+        content += chunk
+
+        if choice.get('finish_reason') != 'length':
+            return content, usage_total, None
+        if attempt == MAX_CONTINUATIONS:
+            break
+
+        # Truncated: ask the model to carry on from where it stopped
+        attempt += 1
+        messages = base_messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": CONTINUE_INSTRUCTION}
+        ]
+
+    return content, usage_total, (
+        f"Error: {model_name} output was truncated after "
+        f"{MAX_CONTINUATIONS} continuation(s) ({usage_total['completion_tokens']} tokens)"
+    )
+
+
+def generate_code(model_name, model_id, dataset_context, request_prompt, prompt_to_use, complexity=None):
+    """Generate visualization code from one model.
+
+    Args:
+        model_name (str): Display name of the model
+        model_id (str): OpenRouter model identifier
+        dataset_context (str): Dataset columns and sample rows (cacheable prefix)
+        request_prompt (str): Request-specific part of the prompt
+        prompt_to_use (str): The user's visualization request
+        complexity (str, optional): Problem complexity used for the token budget
+
+    Returns:
+        dict: Result with 'code', 'model_id', 'success', 'prompt' and, on
+            success, 'usage' (prompt, cached and completion token counts)
+    """
+    messages = build_messages(dataset_context, request_prompt)
+    max_tokens = get_token_budget(model_id, complexity)
+
+    try:
+        content, usage, error = complete_with_continuations(model_name, model_id, messages, max_tokens)
+        if error:
+            return error_result(error, model_id, prompt_to_use)
+
+        code = clean_code(content)
+        if not code or not code.strip():
+            return error_result(
+                f"Error: {model_name} returned empty code", model_id, prompt_to_use
+            )
+
+        record_completion_tokens(model_id, complexity, usage['completion_tokens'])
+        return {
+            'code': code,
+            'model_id': model_id,
+            'success': True,
+            'prompt': prompt_to_use,
+            'usage': usage
+        }
+    except Exception as e:
+        return error_result(f"Exception: {str(e)}", model_id, prompt_to_use)
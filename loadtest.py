@@ -0,0 +1,322 @@
+"""Multi-session load test for the PromptVix generate-and-render flow.
+
+Simulates N concurrent analysts going through the same stages as
+``handle_prompt_tab`` (load dataset, generate with every model, render the
+code, submit feedback) against local OpenRouter/PostgREST stand-ins, and
+reports per-stage latency percentiles, throughput and process RSS.
+
+Example:
+    python loadtest.py --sessions 20 --iterations 3 --latency 2.0 --error-rate 0.05
+    python loadtest.py --sessions 50 --compare loadtest_results/20250101-120000.json
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from mock_services import add_settings_arguments, settings_from_args, start_servers
+
+STAGES = ['load', 'generate', 'render', 'feedback', 'total']
+
+RESULTS_DIR = 'loadtest_results'
+
+
+def current_rss_mb():
+    """Return the resident set size of this process in MB."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux; used as a peak-only fallback elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler(threading.Thread):
+    """Background thread recording RSS while the test runs."""
+
+    def __init__(self, interval=0.5):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(current_rss_mb())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.samples.append(current_rss_mb())
+
+
+def configure_environment(openrouter_url, supabase_url, cache_dir):
+    """Point the app configuration at the mock servers before it is imported."""
+    os.environ['OPENROUTER_BASE_URL'] = openrouter_url
+    os.environ['OPENROUTER_API_KEY'] = 'mock-key'
+    os.environ['SUPABASE_URL'] = supabase_url
+    # supabase-py only accepts JWT-shaped keys
+    os.environ['SUPABASE_ANON_KEY'] = 'mock.mock.mock'
+    # Keep learned budgets and caches away from the real ones
+    os.environ['PROMPTVIX_CACHE_DIR'] = cache_dir
+
+
+def run_load_test(args, openrouter_url, supabase_url):
+    """Run the simulated sessions and collect stage timings.
+
+    Args:
+        args (argparse.Namespace): Parsed command line options
+        openrouter_url (str): Base URL of the OpenRouter stand-in
+        supabase_url (str): URL of the PostgREST stand-in
+
+    Returns:
+        dict: Raw timings per stage, error counts and wall time
+    """
+    configure_environment(openrouter_url, supabase_url, tempfile.mkdtemp(prefix='promptvix-loadtest-'))
+
+    import pandas as pd
+
+    from config import AVAILABLE_MODELS
+    from generation import build_execution_context, build_prompt_parts, run_code
+    from llm_client import generate_code, get_coalescing_stats
+    from prompt_scenarios import BUSINESS_PROBLEMS
+    from supabase_feedback import save_feedback_to_supabase
+    from utils import dataset_fingerprint
+
+    # Resident dataset shared by all sessions, fingerprinted once as in the app
+    base_df = pd.read_csv(args.dataset, encoding='latin1')
+    fingerprint = dataset_fingerprint(base_df)
+    problems = list(BUSINESS_PROBLEMS.items())
+
+    timings = {stage: [] for stage in STAGES}
+    errors = {'generate': 0, 'render': 0, 'feedback': 0}
+    timings_lock = threading.Lock()
+    start_barrier = threading.Barrier(args.sessions)
+
+    def record(stage, seconds):
+        with timings_lock:
+            timings[stage].append(seconds)
+
+    def count_error(stage):
+        with timings_lock:
+            errors[stage] += 1
+
+    def session(session_index):
+        rng = random.Random((args.seed or 0) + session_index)
+        start_barrier.wait()
+        for iteration in range(args.iterations):
+            if args.same_problem:
+                problem_name, details = problems[0]
+            else:
+                problem_name, details = rng.choice(problems)
+            prompt_to_use = problem_name + " using " + details['Visualization Type']
+            started = time.perf_counter()
+
+            # Load: dataset access and prompt construction done on every rerun
+            stage_start = time.perf_counter()
+            df = base_df
+            dataset_context, request_prompt = build_prompt_parts(df, fingerprint, prompt_to_use)
+            record('load', time.perf_counter() - stage_start)
+
+            # Generate: one request per model, as the Generate button does
+            stage_start = time.perf_counter()
+            results = {
+                model_name: generate_code(
+                    model_name, model_id, dataset_context, request_prompt, prompt_to_use,
+                    complexity=details['Complexity']
+                )
+                for model_name, model_id in AVAILABLE_MODELS.items()
+            }
+            record('generate', time.perf_counter() - stage_start)
+            for result in results.values():
+                if not result['success']:
+                    count_error('generate')
+
+            # Render: execute each successful result and serialize the figure
+            stage_start = time.perf_counter()
+            _, extra_vars = build_execution_context(df, fingerprint, prompt_to_use)
+            for result in results.values():
+                if not result['success']:
+                    continue
+                # run_code serializes renders, like in a Streamlit server
+                try:
+                    run_code(result['code'], df, extra_vars)
+                except Exception:
+                    count_error('render')
+            record('render', time.perf_counter() - stage_start)
+
+            # Feedback: one submission per session iteration
+            stage_start = time.perf_counter()
+            model_name, result = next(iter(results.items()))
+            feedback = save_feedback_to_supabase(
+                model_name=model_name,
+                prompt=prompt_to_use,
+                problem_id=details['ProblemID'],
+                visual_accuracy=rng.randint(1, 5),
+                visual_insightfulness=rng.randint(1, 5),
+                business_relevance=rng.randint(1, 5),
+                iteration_count=iteration + 1,
+                positive_outcomes="",
+                negative_outcomes="",
+                code=result['code']
+            )
+            if not feedback['success']:
+                count_error('feedback')
+            record('feedback', time.perf_counter() - stage_start)
+
+            record('total', time.perf_counter() - started)
+            if args.think_time:
+                time.sleep(rng.uniform(0, args.think_time))
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+
+    return {
+        'timings': timings,
+        'errors': errors,
+        'wall_time': wall_time,
+        'coalescing': get_coalescing_stats(),
+    }
+
+
+def summarize(raw, rss_samples):
+    """Reduce raw timings to percentiles, throughput and memory figures.
+
+    Args:
+        raw (dict): Output of ``run_load_test``
+        rss_samples (list): RSS samples in MB
+
+    Returns:
+        dict: Summary suitable for printing and saving
+    """
+    stages = {}
+    for stage, values in raw['timings'].items():
+        if not values:
+            continue
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        stages[stage] = {
+            'count': len(values),
+            'mean': float(np.mean(values)),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(np.max(values)),
+        }
+    completed = len(raw['timings']['total'])
+    return {
+        'stages': stages,
+        'throughput_per_min': completed / raw['wall_time'] * 60 if raw['wall_time'] else 0.0,
+        'completed_iterations': completed,
+        'wall_time': raw['wall_time'],
+        'errors': raw['errors'],
+        'coalescing': raw['coalescing'],
+        'rss_mb': {
+            'start': rss_samples[0] if rss_samples else None,
+            'peak': max(rss_samples) if rss_samples else None,
+            'end': rss_samples[-1] if rss_samples else None,
+        },
+    }
+
+
+def print_summary(summary, baseline=None):
+    """Print a summary table, with deltas against a baseline run if given."""
+    print(f"\n{'stage':<10}{'count':>7}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'max (s)':>10}")
+    for stage in STAGES:
+        stats = summary['stages'].get(stage)
+        if not stats:
+            continue
+        line = (
+            f"{stage:<10}{stats['count']:>7}{stats['p50']:>10.3f}"
+            f"{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}"
+        )
+        base = (baseline or {}).get('stages', {}).get(stage)
+        if base and base['p95']:
+            line += f"   p95 {(stats['p95'] - base['p95']) / base['p95']:+.0%} vs baseline"
+        print(line)
+
+    rss = summary['rss_mb']
+    print(f"\nThroughput: {summary['throughput_per_min']:.1f} iterations/min "
+          f"({summary['completed_iterations']} in {summary['wall_time']:.1f}s)")
+    print(f"RSS (MB): start {rss['start']:.0f}, peak {rss['peak']:.0f}, end {rss['end']:.0f}")
+    print(f"Errors: {summary['errors']}")
+    print(f"Coalescing: {summary['coalescing']}")
+    if baseline:
+        print(f"Baseline throughput: {baseline['throughput_per_min']:.1f} iterations/min, "
+              f"peak RSS {baseline['rss_mb']['peak']:.0f} MB")
+
+
+def git_revision():
+    """Return the current git commit, if available."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PromptVix multi-session load test")
+    parser.add_argument('--sessions', type=int, default=10, help='Concurrent simulated analysts')
+    parser.add_argument('--iterations', type=int, default=3, help='Generate/render/feedback rounds per session')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Max random pause between rounds (s)')
+    parser.add_argument('--same-problem', action='store_true', help='All sessions pick the same business problem')
+    parser.add_argument('--dataset', default='Superstore_Dataset.csv')
+    parser.add_argument('--openrouter-url', help='Use an already running OpenRouter stand-in')
+    parser.add_argument('--supabase-url', help='Use an already running PostgREST stand-in')
+    parser.add_argument('--output', help='Where to save the results JSON')
+    parser.add_argument('--compare', help='Previous results JSON to compare against')
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    if args.openrouter_url and args.supabase_url:
+        openrouter_url, supabase_url = args.openrouter_url, args.supabase_url
+    else:
+        openrouter_url, supabase_url, _ = start_servers(0, 0, settings_from_args(args))
+
+    sampler = RssSampler()
+    sampler.start()
+    raw = run_load_test(args, openrouter_url, supabase_url)
+    sampler.stop()
+
+    summary = summarize(raw, sampler.samples)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['summary']
+    print_summary(summary, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': sys.version.split()[0],
+            'parameters': vars(args),
+            'summary': summary,
+        }, f, indent=2)
+    print(f"\nSaved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Sparse co-occurrence engine for Market Basket Analysis."""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import streamlit as st
+
+from config import BASKET_TOP_K
+
+ORDER_COLUMN = 'Order ID'
+ITEM_COLUMN = 'Product Name'
+
+# Prompt keywords that indicate a basket / co-purchase analysis
+BASKET_KEYWORDS = ('market basket', 'frequently purchased', 'bought together', 'co-occurrence', 'cooccurrence')
+
+PAIR_COLUMNS = [
+    'item_a', 'item_b', 'count', 'support',
+    'confidence_a_to_b', 'confidence_b_to_a', 'lift'
+]
+
+
+def wants_basket_analysis(prompt, columns):
+    """Check whether a prompt asks for basket analysis on a suitable dataset.
+
+    Args:
+        prompt (str): Visualization request
+        columns (iterable): Columns of the current dataset
+
+    Returns:
+        bool: True if pairs should be precomputed for this request
+    """
+    columns = set(columns)
+    if ORDER_COLUMN not in columns or ITEM_COLUMN not in columns:
+        return False
+    prompt = (prompt or "").lower()
+    return any(keyword in prompt for keyword in BASKET_KEYWORDS)
+
+
+def build_basket_matrix(df, order_col=ORDER_COLUMN, item_col=ITEM_COLUMN):
+    """Build a binary sparse order x item incidence matrix.
+
+    Args:
+        df (pd.DataFrame): Order lines
+        order_col (str): Column identifying the basket
+        item_col (str): Column identifying the item
+
+    Returns:
+        tuple: (scipy.sparse.csr_matrix, pd.Index of orders, pd.Index of items)
+    """
+    lines = df[[order_col, item_col]].dropna()
+    order_codes, orders = pd.factorize(lines[order_col])
+    item_codes, items = pd.factorize(lines[item_col])
+    matrix = sp.csr_matrix(
+        (np.ones(len(lines), dtype=np.int32), (order_codes, item_codes)),
+        shape=(len(orders), len(items))
+    )
+    # Repeated order lines for the same item count once per basket
+    matrix.data[:] = 1
+    return matrix, orders, items
+
+
+def compute_item_pairs(df, top_k=BASKET_TOP_K, min_count=2, order_col=ORDER_COLUMN, item_col=ITEM_COLUMN):
+    """Compute co-occurrence, support, confidence and lift for item pairs.
+
+    Pair counts come from a single sparse product ``X.T @ X`` of the order x
+    item matrix, so the cost grows with the number of co-purchased pairs
+    rather than quadratically with the number of order lines.
+
+    Args:
+        df (pd.DataFrame): Order lines
+        top_k (int): Number of pairs to keep, ranked by count then lift
+        min_count (int): Minimum number of baskets a pair must appear in
+        order_col (str): Column identifying the basket
+        item_col (str): Column identifying the item
+
+    Returns:
+        tuple: (pairs DataFrame with PAIR_COLUMNS, items DataFrame with
+            'item', 'count' and 'support')
+    """
+    matrix, orders, items = build_basket_matrix(df, order_col, item_col)
+    n_orders = max(len(orders), 1)
+
+    item_counts = np.asarray(matrix.sum(axis=0)).ravel()
+    item_support = item_counts / n_orders
+    item_frame = pd.DataFrame({
+        'item': items,
+        'count': item_counts,
+        'support': item_support,
+    }).sort_values('count', ascending=False, ignore_index=True)
+
+    co = sp.triu(matrix.T @ matrix, k=1).tocoo()
+    keep = co.data >= min_count
+    rows, cols, counts = co.row[keep], co.col[keep], co.data[keep]
+    if len(counts) == 0:
+        return pd.DataFrame(columns=PAIR_COLUMNS), item_frame
+
+    support = counts / n_orders
+    lift = support / (item_support[rows] * item_support[cols])
+
+    if len(counts) > top_k:
+        # Cheap partial selection first, exact ordering on the survivors
+        candidates = np.argpartition(-counts, top_k - 1)[:top_k]
+        rows, cols, counts = rows[candidates], cols[candidates], counts[candidates]
+        support, lift = support[candidates], lift[candidates]
+    order = np.lexsort((-lift, -counts))
+
+    pairs = pd.DataFrame({
+        'item_a': items[rows[order]],
+        'item_b': items[cols[order]],
+        'count': counts[order],
+        'support': support[order],
+        'confidence_a_to_b': counts[order] / item_counts[rows[order]],
+        'confidence_b_to_a': counts[order] / item_counts[cols[order]],
+        'lift': lift[order],
+    })
+    return pairs, item_frame
+
+
+@st.cache_data(show_spinner="Computing item co-occurrence...", max_entries=8)
+def get_basket_tables(fingerprint, _df, top_k=BASKET_TOP_K):
+    """Return cached basket tables for a dataset fingerprint.
+
+    Args:
+        fingerprint (str): Dataset fingerprint (cache key)
+        _df (pd.DataFrame): Dataset; excluded from Streamlit's hashing
+        top_k (int): Number of pairs to keep
+
+    Returns:
+        tuple: (pairs DataFrame, items DataFrame)
+    """
+    return compute_item_pairs(_df, top_k=top_k)
+
+
+def describe_basket_tables(pairs):
+    """Describe the precomputed tables for inclusion in the LLM prompt.
+
+    Args:
+        pairs (pd.DataFrame): Pairs table returned by ``compute_item_pairs``
+
+    Returns:
+        str: Prompt section explaining the available variables
+    """
+    return (
+        f"Precomputed market basket tables (use these; do not build item pairs with loops):\n"
+        f"- 'basket_pairs': top {len(pairs)} product pairs bought in the same order, "
+        f"columns: {', '.join(PAIR_COLUMNS)}; sorted by count then lift\n"
+        f"- 'basket_items': per-product 'item', 'count' (orders containing it) and 'support'\n"
+        f"Sample of basket_pairs:\n{pairs.head(3).to_string(index=False)}"
+    )
@@ -0,0 +1,306 @@
+"""Local stand-ins for OpenRouter and Supabase PostgREST used by load tests.
+
+Run standalone with:
+    python mock_services.py --openrouter-port 8701 --postgrest-port 8702 --latency 1.5
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Canned completion: valid matplotlib code inside a fenced block
+MOCK_CODE = """```python
+import matplotlib.pyplot as plt
+summary = df.groupby('Segment')['Profit'].sum().sort_values()
+fig_mpl, ax = plt.subplots(figsize=(8, 4))
+summary.plot(kind='barh', ax=ax, color='steelblue')
+ax.set_title('Profit by Segment')
+ax.set_xlabel('Profit')
+plt.tight_layout()
+plt.show()
+```"""
+
+
+@dataclass
+class MockSettings:
+    """Behaviour of the mock servers."""
+
+    latency: float = 1.0
+    jitter: float = 0.3
+    token_latency: float = 0.0
+    error_rate: float = 0.0
+    truncation_rate: float = 0.0
+    postgrest_latency: float = 0.05
+    seed: int = None
+
+
+def _sleep(settings, base):
+    """Sleep for ``base`` seconds plus uniform jitter."""
+    if base > 0:
+        time.sleep(max(0.0, base + random.uniform(-settings.jitter, settings.jitter) * base))
+
+
+def _remaining_content(messages):
+    """Return the part of the canned completion a continuation request still needs.
+
+    A continuation repeats the conversation with the cut-off answer as an
+    assistant turn (optionally followed by a "continue" instruction). If
+    that answer is a strict prefix of the canned completion, only the rest
+    is sent, so stitched continuations form the original code.
+    """
+    for message in reversed(messages[-2:]):
+        if message.get('role') == 'assistant':
+            previous = message.get('content') or ''
+            if isinstance(previous, str) and previous and len(previous) < len(MOCK_CODE) \
+                    and MOCK_CODE.startswith(previous):
+                return MOCK_CODE[len(previous):]
+            break
+    return MOCK_CODE
+
+
+def make_openrouter_handler(settings):
+    """Build a request handler class mimicking the chat completions API.
+
+    Args:
+        settings (MockSettings): Latency, error and truncation behaviour
+
+    Returns:
+        type: BaseHTTPRequestHandler subclass
+    """
+
+    class OpenRouterHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': 'not found'}})
+                return
+
+            _sleep(settings, settings.latency)
+            if random.random() < settings.error_rate:
+                status = random.choice([429, 500, 502])
+                self._send_json(status, {'error': {'code': status, 'message': 'mock upstream error'}})
+                return
+
+            content = _remaining_content(payload.get('messages', []))
+            for stop in payload.get('stop') or []:
+                # Like the real API, the stop sequence itself is not returned
+                if stop in content:
+                    content = content[:content.index(stop)]
+            finish_reason = 'stop'
+            if random.random() < settings.truncation_rate and len(content) > 1:
+                content = content[:len(content) // 2]
+                finish_reason = 'length'
+            tokens = max(1, len(content) // 4)
+            prompt_tokens = sum(len(json.dumps(m.get('content', ''))) for m in payload.get('messages', [])) // 4
+
+            if payload.get('stream'):
+                self._stream(payload, content, finish_reason, tokens, prompt_tokens)
+                return
+
+            time.sleep(settings.token_latency * tokens)
+            self._send_json(200, {
+                'id': f"mock-{random.getrandbits(32):08x}",
+                'model': payload.get('model'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': finish_reason,
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': tokens,
+                    'total_tokens': prompt_tokens + tokens,
+                },
+            })
+
+        def _stream(self, payload, content, finish_reason, tokens, prompt_tokens):
+            """Send the completion as server-sent events, one chunk per ~token."""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+            for i, piece in enumerate(pieces):
+                chunk = {
+                    'model': payload.get('model'),
+                    'choices': [{
+                        'index': 0,
+                        'delta': {'content': piece},
+                        'finish_reason': finish_reason if i == len(pieces) - 1 else None,
+                    }],
+                }
+                if i == len(pieces) - 1:
+                    chunk['usage'] = {'prompt_tokens': prompt_tokens, 'completion_tokens': tokens}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(settings.token_latency)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return OpenRouterHandler
+
+
+def make_postgrest_handler(settings):
+    """Build a request handler class mimicking PostgREST for the feedback table.
+
+    Args:
+        settings (MockSettings): Latency behaviour
+
+    Returns:
+        type: BaseHTTPRequestHandler subclass
+    """
+    rows = []
+    lock = threading.Lock()
+
+    class PostgRESTHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        def _table(self):
+            parsed = urlparse(self.path)
+            return parsed.path.rstrip('/').rsplit('/', 1)[-1], parse_qs(parsed.query)
+
+        def do_GET(self):
+            _sleep(settings, settings.postgrest_latency)
+            table, query = self._table()
+            if table != 'feedback':
+                self._send_json(404, {'message': f'relation "{table}" does not exist'})
+                return
+            with lock:
+                selected = list(rows)
+            created_filter = query.get('created_at', [''])[0]
+            if created_filter.startswith('gte.'):
+                selected = [r for r in selected if r['created_at'] >= created_filter[4:]]
+            elif created_filter.startswith('gt.'):
+                selected = [r for r in selected if r['created_at'] > created_filter[3:]]
+            headers = {}
+            if 'count=exact' in (self.headers.get('Prefer') or ''):
+                end = max(len(selected) - 1, 0)
+                headers['Content-Range'] = f"0-{end}/{len(selected)}"
+            self._send_json(200, selected, headers)
+
+        do_HEAD = do_GET
+
+        def do_POST(self):
+            _sleep(settings, settings.postgrest_latency)
+            table, _ = self._table()
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'[]')
+            new_rows = body if isinstance(body, list) else [body]
+            with lock:
+                for row in new_rows:
+                    row = dict(row)
+                    row['id'] = len(rows) + 1
+                    rows.append(row)
+                inserted = rows[-len(new_rows):]
+            self._send_json(201, inserted)
+
+    return PostgRESTHandler
+
+
+def start_servers(openrouter_port, postgrest_port, settings, host='127.0.0.1'):
+    """Start both mock servers on background threads.
+
+    Args:
+        openrouter_port (int): Port for the OpenRouter stand-in (0 = any free port)
+        postgrest_port (int): Port for the PostgREST stand-in (0 = any free port)
+        settings (MockSettings): Behaviour of the mock servers
+        host (str): Interface to bind
+
+    Returns:
+        tuple: (openrouter_base_url, supabase_url, list of servers)
+    """
+    if settings.seed is not None:
+        random.seed(settings.seed)
+    servers = [
+        ThreadingHTTPServer((host, openrouter_port), make_openrouter_handler(settings)),
+        ThreadingHTTPServer((host, postgrest_port), make_postgrest_handler(settings)),
+    ]
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    openrouter_url = f"http://{host}:{servers[0].server_address[1]}/api/v1"
+    supabase_url = f"http://{host}:{servers[1].server_address[1]}"
+    return openrouter_url, supabase_url, servers
+
+
+def add_settings_arguments(parser):
+    """Add mock behaviour options to an argument parser."""
+    parser.add_argument('--latency', type=float, default=1.0, help='Mean completion latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.3, help='Relative latency jitter (0-1)')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='Extra seconds per completion token (decode speed)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of completions failing with 429/5xx')
+    parser.add_argument('--truncation-rate', type=float, default=0.0, help='Fraction of completions cut off with finish_reason=length')
+    parser.add_argument('--postgrest-latency', type=float, default=0.05, help='Mean PostgREST latency (s)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+
+
+def settings_from_args(args):
+    """Build MockSettings from parsed arguments."""
+    return MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_latency=args.token_latency,
+        error_rate=args.error_rate,
+        truncation_rate=args.truncation_rate,
+        postgrest_latency=args.postgrest_latency,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenRouter and PostgREST servers")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--openrouter-port', type=int, default=8701)
+    parser.add_argument('--postgrest-port', type=int, default=8702)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    openrouter_url, supabase_url, _ = start_servers(
+        args.openrouter_port, args.postgrest_port, settings_from_args(args), host=args.host
+    )
+    print(f"OPENROUTER_BASE_URL={openrouter_url}")
+    print(f"SUPABASE_URL={supabase_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Bootstrap comparison of models across feedback ratings."""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config import BOOTSTRAP_MAX_ELEMENTS
+
+# Columns with at most this many distinct values are resampled from counts
+MAX_CATEGORIES = 64
+
+# Feedback metrics and whether higher values are better
+METRICS = {
+    'visual_accuracy': True,
+    'visual_insightfulness': True,
+    'business_relevance': True,
+    'iteration': False,
+}
+
+
+def snapshot_version(feedback_df):
+    """Identify a feedback snapshot so derived results can be cached.
+
+    Args:
+        feedback_df (pd.DataFrame): Feedback rows
+
+    Returns:
+        str: Version string that changes whenever rows are added or removed
+    """
+    if feedback_df.empty:
+        return "empty"
+    parts = [str(len(feedback_df))]
+    for column in ('id', 'created_at'):
+        if column in feedback_df.columns:
+            parts.append(str(feedback_df[column].max()))
+    return "-".join(parts)
+
+
+def bootstrap_means(values, n_resamples, rng):
+    """Bootstrap the mean of one metric, ignoring NaN values.
+
+    Ratings take a handful of distinct values, so a resample is fully
+    described by how often each value is drawn: one multinomial draw of
+    the category counts per resample costs O(B x k) instead of O(B x n).
+    Columns with many distinct values fall back to index resampling in row
+    blocks capped at ``BOOTSTRAP_MAX_ELEMENTS`` indices.
+
+    Args:
+        values (np.ndarray): Metric values for the group
+        n_resamples (int): Number of bootstrap resamples (B)
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: (B,) resampled means, all NaN if the group has no values
+    """
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return np.full(n_resamples, np.nan)
+    categories, counts = np.unique(values, return_counts=True)
+    if len(categories) <= MAX_CATEGORIES:
+        draws = rng.multinomial(n, counts / n, size=n_resamples)
+        return draws @ categories / n
+
+    block = max(1, min(n_resamples, BOOTSTRAP_MAX_ELEMENTS // n))
+    means = np.empty(n_resamples)
+    for start in range(0, n_resamples, block):
+        stop = min(start + block, n_resamples)
+        idx = rng.integers(0, n, size=(stop - start, n), dtype=np.int32)
+        means[start:stop] = values[idx].mean(axis=1)
+    return means
+
+
+def bootstrap_group(values, n_resamples, rng):
+    """Bootstrap the column means of one group.
+
+    Args:
+        values (np.ndarray): (n x m) metric values for the group
+        n_resamples (int): Number of bootstrap resamples (B)
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: (B x m) resampled means; NaN values are ignored
+    """
+    return np.column_stack([
+        bootstrap_means(values[:, j], n_resamples, rng) for j in range(values.shape[1])
+    ]).reshape(n_resamples, values.shape[1])
+
+
+def _summaries(feedback_df, group_columns, metrics, n_resamples, confidence, rng):
+    """Compute means and bootstrap CIs per group.
+
+    Returns:
+        tuple: (summary DataFrame, dict of group key to (B x m) resampled means)
+    """
+    alpha = (1 - confidence) / 2
+    rows = []
+    distributions = {}
+    for key, group in feedback_df.groupby(group_columns, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        values = group[metrics].to_numpy(dtype=float)
+        resampled = bootstrap_group(values, n_resamples, rng)
+        distributions[key[0] if len(key) == 1 else key] = resampled
+        for j, metric in enumerate(metrics):
+            observed = values[:, j][~np.isnan(values[:, j])]
+            if len(observed):
+                low, high = np.quantile(resampled[:, j], [alpha, 1 - alpha])
+                mean = observed.mean()
+            else:
+                low = high = mean = np.nan
+            rows.append({
+                **dict(zip(group_columns, key)),
+                'metric': metric,
+                'n': len(observed),
+                'mean': float(mean),
+                'ci_low': float(low),
+                'ci_high': float(high),
+            })
+    return pd.DataFrame(rows), distributions
+
+
+def win_rates(distributions, metrics):
+    """Compute pairwise win rates between models from bootstrap means.
+
+    The win rate of A over B is the share of resamples in which A's mean is
+    better than B's (ties count half), using each metric's direction.
+    Models without any rating for a metric get no win rate for it.
+
+    Args:
+        distributions (dict): Model name to (B x m) resampled means
+        metrics (list): Metric names matching the distribution columns
+
+    Returns:
+        dict: Metric name to a models x models win-rate DataFrame
+    """
+    models = sorted(distributions)
+    result = {}
+    for j, metric in enumerate(metrics):
+        stacked = np.stack([distributions[model][:, j] for model in models])  # (k x B)
+        if not METRICS[metric]:
+            stacked = -stacked
+        diff = stacked[:, None, :] - stacked[None, :, :]                         # (k x k x B)
+        rates = (diff > 0).mean(axis=2) + 0.5 * (diff == 0).mean(axis=2)
+        unrated = np.isnan(stacked).all(axis=1)
+        rates[unrated, :] = np.nan
+        rates[:, unrated] = np.nan
+        np.fill_diagonal(rates, np.nan)
+        result[metric] = pd.DataFrame(rates, index=models, columns=models)
+    return result
+
+
+@st.cache_data(show_spinner="Bootstrapping model comparison...", max_entries=16)
+def compare_models(version, _feedback_df, n_resamples=2000, confidence=0.95, seed=0):
+    """Compare models overall and per problem with bootstrap intervals.
+
+    Results are cached by feedback snapshot version and parameters.
+
+    Args:
+        version (str): Snapshot version from ``snapshot_version`` (cache key)
+        _feedback_df (pd.DataFrame): Feedback rows; excluded from hashing
+        n_resamples (int): Number of bootstrap resamples
+        confidence (float): Confidence level of the intervals
+        seed (int): Random seed for reproducible intervals
+
+    Returns:
+        dict: 'models' (per-model summary), 'problems' (per problem and model
+            summary) and 'win_rates' (metric to win-rate matrix)
+    """
+    metrics = [metric for metric in METRICS if metric in _feedback_df.columns]
+    empty = {'models': pd.DataFrame(), 'problems': pd.DataFrame(), 'win_rates': {}}
+    if not metrics or 'model_name' not in _feedback_df.columns:
+        return empty
+
+    keys = ['model_name'] + (['problem_id'] if 'problem_id' in _feedback_df.columns else [])
+    data = _feedback_df[keys + metrics].copy()
+    data[metrics] = data[metrics].apply(pd.to_numeric, errors='coerce')
+    data = data.dropna(subset=['model_name'])
+    if data.empty:
+        return empty
+
+    rng = np.random.default_rng(seed)
+    models, model_distributions = _summaries(data, ['model_name'], metrics, n_resamples, confidence, rng)
+    problems = pd.DataFrame()
+    if 'problem_id' in data.columns:
+        problems, _ = _summaries(data, ['problem_id', 'model_name'], metrics, n_resamples, confidence, rng)
+    return {
+        'models': models,
+        'problems': problems,
+        'win_rates': win_rates(model_distributions, metrics),
+    }
@@ -0,0 +1,84 @@
+"""Opt-in profiling of generated code execution.
+
+Records wall and CPU time, the tracemalloc peak and the top cProfile
+hotspots of one execution, as a JSON-serializable summary that can be shown
+in the UI and stored with the feedback record.
+"""
+
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+
+from config import PROFILE_TOP_N
+
+
+class ExecutionProfiler:
+    """Context manager profiling the code run inside it.
+
+    CPU time and cProfile cover the calling thread only. tracemalloc is
+    process-wide, so allocations by other threads during the run count
+    towards the peak; executions are serialized, which keeps this small.
+
+    Attributes:
+        summary (dict): Filled on exit with 'wall_seconds', 'cpu_seconds',
+            'peak_memory_bytes' and 'hotspots'
+    """
+
+    def __init__(self, top_n=PROFILE_TOP_N):
+        self.top_n = top_n
+        self.summary = None
+        self._profile = cProfile.Profile()
+        self._started_tracing = False
+
+    def __enter__(self):
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        self._memory_start = tracemalloc.get_traced_memory()[0]
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profile.disable()
+        cpu_seconds = time.thread_time() - self._cpu_start
+        wall_seconds = time.perf_counter() - self._wall_start
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+        self.summary = {
+            'wall_seconds': round(wall_seconds, 4),
+            'cpu_seconds': round(cpu_seconds, 4),
+            'peak_memory_bytes': max(0, peak - self._memory_start),
+            'hotspots': self._hotspots(),
+            'failed': exc_type is not None,
+        }
+        return False
+
+    def _hotspots(self):
+        """Return the functions with the most own time."""
+        stats = pstats.Stats(self._profile)
+        rows = []
+        for (filename, line, name), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                'function': name,
+                'location': f"{os.path.basename(filename)}:{line}" if line else 'built-in',
+                'calls': ncalls,
+                'own_seconds': round(tottime, 4),
+                'cumulative_seconds': round(cumtime, 4),
+            })
+        rows.sort(key=lambda row: row['own_seconds'], reverse=True)
+        return rows[:self.top_n]
+
+
+def format_bytes(num_bytes):
+    """Format a byte count for display (e.g. '12.3 MB')."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024 or unit == 'GB':
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
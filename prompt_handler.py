@@ -1,27 +1,25 @@
 import os
-import re
-import requests
+import uuid
+from datetime import datetime
 
-import matplotlib
-import matplotlib.pyplot as plt
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 
-from config import (
-    AVAILABLE_MODELS,
-    DEFAULT_DATASET_PATH,
-    MAX_TOKENS,
-    OPENROUTER_API_KEY,
-    TEMPERATURE,
-    OPENROUTER_BASE_URL,
-)
+from config import AVAILABLE_MODELS, DEFAULT_DATASET_PATH, GENERATION_SERVICE_URL
+from exporter import render_export
+from figure_transport import load_plotly_payload
+from generation import build_execution_context, build_prompt_parts, iter_generations, run_code
+from generation_service import GenerationServiceClient
+from profiling import ExecutionProfiler, format_bytes
+from llm_client import get_coalescing_stats, get_prompt_cache_stats
 from prompt_scenarios import business_problems
+from refinement import refine_code
+from result_history import get_history_store
+from similarity_index import get_prompt_index
+from shared_dataset import get_shared_upload, load_shared_dataset
+from speculation import cancel_speculation, get_budget_stats, get_speculation_owner, speculate
 from supabase_feedback import get_feedback_count, save_feedback_to_supabase
 
-# Configure matplotlib for Streamlit compatibility
-matplotlib.use('Agg')  # Use non-interactive backend for Streamlit
-
 def get_model_background_color(model_name):
     """Return a subtle background color for each model.
     
@@ -193,6 +191,168 @@ NEGATIVE_OUTCOMES = [
     "5: Unstable output (similar prompts produced inconsistent or contradictory visuals)"
 ]
 
+def execute_and_render(code, df, model_name, extra_vars=None, profiler=None):
+    """Execute generated visualization code and display the resulting figure.
+    
+    Args:
+        code (str): Generated Python code
+        df (pd.DataFrame): Shared dataset; the code gets an isolated view as 'df'
+        model_name (str): Name of the model that produced the code
+        extra_vars (dict, optional): Precomputed tables exposed to the code
+        profiler (ExecutionProfiler, optional): Records the execution's profile
+        
+    Returns:
+        tuple: (kind, bytes) of the rendered figure ('plotly_json' or 'png'),
+            or None if execution failed
+    """
+    try:
+        artifact = run_code(code, df, extra_vars, profiler)
+    except Exception as e:
+        st.error(f"Error executing code from {model_name}: {e}")
+        return None
+    render_artifact(*artifact)
+    return artifact
+
+
+def render_profile(profile):
+    """Display an execution profile in a collapsible panel.
+    
+    Args:
+        profile (dict): Summary from ``ExecutionProfiler``
+    """
+    with st.expander("🔬 Execution Profile", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Wall time", f"{profile['wall_seconds']:.2f} s")
+        col2.metric("CPU time", f"{profile['cpu_seconds']:.2f} s")
+        col3.metric("Peak memory", format_bytes(profile['peak_memory_bytes']))
+        if profile.get('failed'):
+            st.caption("Execution raised an error; figures cover the run up to the failure.")
+        st.markdown("**Top hotspots (by own time):**")
+        st.dataframe(pd.DataFrame(profile['hotspots']), hide_index=True)
+
+
+def generate_with_service(df, fingerprint, dataset_context, request_prompt, prompt_to_use, complexity,
+                          profile=False):
+    """Run generation and rendering on the generation service.
+    
+    Args:
+        df (pd.DataFrame): Current dataset (uploaded once per fingerprint)
+        fingerprint (str): Fingerprint of the current dataset
+        dataset_context (str): Dataset columns and sample rows
+        request_prompt (str): Request-specific part of the prompt
+        prompt_to_use (str): The user's visualization request
+        complexity (str): Problem complexity, or None for custom prompts
+        profile (bool): Profile each execution on the service
+        
+    Returns:
+        dict: Model name to result dict; rendered figures are in 'artifact'
+    """
+    client = GenerationServiceClient(GENERATION_SERVICE_URL)
+    all_results = {}
+    try:
+        client.ensure_dataset(fingerprint, df)
+        job_id = client.submit(
+            AVAILABLE_MODELS, dataset_context, request_prompt, prompt_to_use,
+            complexity=complexity, fingerprint=fingerprint, profile=profile
+        )
+        for model_name, result in client.iter_results(job_id):
+            st.write(f"✅ {model_name} finished")
+            all_results[model_name] = result
+    except Exception as e:
+        st.error(f"Generation service error: {e}")
+    # Models the service could not report on are shown as failed
+    for model_name, model_id in AVAILABLE_MODELS.items():
+        all_results.setdefault(model_name, {
+            'code': "Generation service did not return a result for this model.",
+            'model_id': model_id,
+            'success': False,
+            'prompt': prompt_to_use,
+        })
+    return all_results
+
+
+def refine_results(df, fingerprint, model_names, instruction, history_user_id):
+    """Refine the stored code of some models and record the round as an iteration.
+    
+    Only models whose refinement succeeds are updated; they lose their
+    stored figure so that just their changed scripts are executed again.
+    
+    Args:
+        df (pd.DataFrame): Current dataset
+        fingerprint (str): Fingerprint of the current dataset
+        model_names (list): Models to refine
+        instruction (str): The user's follow-up instruction
+        history_user_id (str): Stable per-user identifier
+        
+    Returns:
+        list: Names of the models whose code changed
+    """
+    all_results = st.session_state['all_results']
+    current_prompt = st.session_state['current_prompt']
+    dataset_context, request_prompt = build_prompt_parts(df, fingerprint, current_prompt)
+    changed = []
+    for model_name in model_names:
+        result = all_results.get(model_name)
+        if not result or not result['success']:
+            continue
+        refined = refine_code(
+            model_name, result['model_id'], dataset_context, request_prompt,
+            result['code'], instruction, current_prompt
+        )
+        if not refined['success']:
+            st.error(f"❌ {refined['code']}")
+            continue
+        if refined['code'] == result['code']:
+            st.warning(f"{model_name} made no changes.")
+            continue
+        refined['refinements'] = result.get('refinements', []) + [
+            {'instruction': instruction, 'patch': refined['patch']}
+        ]
+        all_results[model_name] = refined
+        changed.append(model_name)
+    
+    if changed:
+        # A refinement round counts as another iteration of the same prompt
+        try:
+            st.session_state['history_iteration'] = get_history_store().record_iteration(
+                history_user_id, current_prompt, all_results
+            )
+        except Exception as e:
+            st.session_state['history_iteration'] = None
+            print(f"Result history error: {e}")
+    return changed
+
+
+def render_artifact(kind, data):
+    """Display a rendered figure without executing any code.
+    
+    Args:
+        kind (str): 'plotly_json' or 'png'
+        data (bytes): Serialized figure
+    """
+    st.subheader("🎨 Generated Visualization:")
+    if kind == 'plotly_json':
+        st.plotly_chart(load_plotly_payload(data))
+    else:
+        st.image(data)
+
+
+def get_history_user_id():
+    """Return a per-user id that survives page reloads.
+    
+    The id is kept in the page URL so reloading (or bookmarking) the page
+    reconnects the user to their result history.
+    
+    Returns:
+        str: Stable user identifier
+    """
+    user_id = st.query_params.get('uid')
+    if not user_id:
+        user_id = uuid.uuid4().hex
+        st.query_params['uid'] = user_id
+    return user_id
+
+
 def handle_prompt_tab():
     """Handle the main prompt tab functionality.
     
@@ -225,6 +385,24 @@ def handle_prompt_tab():
         st.sidebar.error(f"❌ Supabase Error: {e}")
         print(f"Supabase connection error: {e}")
 
+    # Show how many identical generations were shared across sessions
+    coalescing_stats = get_coalescing_stats()
+    if coalescing_stats['coalesced_calls'] > 0:
+        st.sidebar.caption(
+            f"🔗 Coalesced requests: {coalescing_stats['coalesced_calls']} "
+            f"(upstream calls: {coalescing_stats['upstream_calls']})"
+        )
+
+    # Show the share of input tokens served from provider prompt caches
+    prompt_cache_stats = get_prompt_cache_stats()
+    total_prompt_tokens = sum(stats['prompt_tokens'] for stats in prompt_cache_stats.values())
+    if total_prompt_tokens:
+        total_cached_tokens = sum(stats['cached_tokens'] for stats in prompt_cache_stats.values())
+        st.sidebar.caption(
+            f"🧊 Prompt cache: {total_cached_tokens / total_prompt_tokens:.0%} of "
+            f"{total_prompt_tokens} input tokens cached"
+        )
+
     # Initialize session state for storing results persistently
     if 'all_results' not in st.session_state:
         st.session_state['all_results'] = {}
@@ -232,39 +410,43 @@ def handle_prompt_tab():
         st.session_state['current_prompt'] = ""
     if 'selected_problem' not in st.session_state:
         st.session_state['selected_problem'] = ""
+    if 'history_iteration' not in st.session_state:
+        st.session_state['history_iteration'] = None
+    
+    history_user_id = get_history_user_id()
 
-    @st.cache_data(show_spinner=True)
     def load_data():
-        """Load the default dataset or return an error if not found."""
+        """Load the shared default dataset or return None if not found."""
         if not os.path.exists(DEFAULT_DATASET_PATH):
             st.error(f"Dataset file not found at: {DEFAULT_DATASET_PATH}")
             return None
         try:
-            df = pd.read_csv(DEFAULT_DATASET_PATH, encoding='latin1')
-            df.to_csv('Superstore_Dataset.csv', encoding='utf-8', index=False)
-            return df
+            return load_shared_dataset(DEFAULT_DATASET_PATH)
         except Exception as e:
             st.error(f"Failed to read CSV file: {e}")
             return None
 
-    # Allow dataset upload or use default
-    df = None
+    # Allow dataset upload or use default. The dataset is shared by all
+    # sessions and must not be modified; exec gets an isolated view.
+    shared = None
     st.subheader("Upload Dataset (optional)")
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
     if uploaded_file:
         try:
-            df = pd.read_csv(uploaded_file)
+            shared = get_shared_upload(uploaded_file)
         except Exception as e:
             st.error(f"Failed to read uploaded CSV: {e}")
-            df = None
+            shared = None
     else:
-        df = load_data()
+        shared = load_data()
 
     if st.button("Reload Dataset"):
         st.cache_data.clear()
-        df = load_data()
+        load_shared_dataset.clear()
+        shared = get_shared_upload(uploaded_file) if uploaded_file else load_data()
 
-    if df is not None:
+    if shared is not None:
+        df, fingerprint = shared.df, shared.fingerprint
         st.subheader("Dataset Information:")
         if uploaded_file:
             st.info(f"📊 Using uploaded dataset: **{uploaded_file.name}**")
@@ -273,15 +455,11 @@ def handle_prompt_tab():
         st.subheader("Data Preview:")
         st.dataframe(df.head(10))
         
-        # Download button for the dataset
-        csv_data = df.to_csv(index=False).encode('utf-8')
+        # Download the exact dataset being used for analysis; built on demand
         dataset_name = uploaded_file.name if uploaded_file else DEFAULT_DATASET_PATH
-        st.download_button(
-            label="📥 Download Dataset",
-            data=csv_data,
-            file_name=dataset_name,
-            mime="text/csv",
-            help="Download the exact dataset being used for analysis"
+        render_export(
+            'dataset', fingerprint, df, os.path.splitext(os.path.basename(dataset_name))[0],
+            label="📥 Download Dataset"
         )
 
         # --- Business Problem Dropdown and Custom Prompt Toggle ---
@@ -321,6 +499,91 @@ def handle_prompt_tab():
         else:
             prompt_to_use = selected_problem + " using " + details['Visualization Type']
 
+        # Opt-in: generate in the background while the problem is being read
+        # (in-process generation only)
+        speculative_prefetch = not GENERATION_SERVICE_URL and st.checkbox(
+            "⚡ Prefetch visualizations for the selected problem",
+            value=False,
+            key="speculative_prefetch",
+            help="Starts generating with all models as soon as a business problem is "
+                 "selected, so results are usually ready when you click Generate. "
+                 "Uses model calls even if you never click."
+        )
+        if not speculative_prefetch:
+            cancel_speculation(st.session_state)
+        elif not use_custom_prompt:
+            speculation_context, speculation_request = build_prompt_parts(df, fingerprint, prompt_to_use)
+            speculation = speculate(
+                st.session_state, (fingerprint, selected_problem), AVAILABLE_MODELS,
+                speculation_context, speculation_request, prompt_to_use, details['Complexity']
+            )
+            budget_stats = get_budget_stats()
+            st.caption(
+                f"⚡ Prefetch {'running' if speculation.is_running() else 'finished'}: "
+                f"{len(speculation.prefetched)}/{len(AVAILABLE_MODELS)} models ready "
+                f"(daily budget {budget_stats['used']}/{budget_stats['limit']})"
+            )
+
+        # Offer the best-rated prior code for a near-identical prompt
+        try:
+            instant_matches = get_prompt_index().query(prompt_to_use, df.columns, top_k=1)
+        except Exception as e:
+            instant_matches = []
+            print(f"Similarity index error: {e}")
+        if instant_matches:
+            match = instant_matches[0]
+            with st.expander(
+                f"⚡ Instant match: {match['similarity']:.0%} similar prompt, "
+                f"rated {match['rating']:.1f}/5",
+                expanded=False
+            ):
+                st.markdown(f"**Previous Prompt:** {match['prompt']}")
+                st.markdown(
+                    f"**Model:** {match['model_name']} | "
+                    f"**Ratings:** {match['votes']}"
+                )
+                st.code(match['code'], language="python")
+                # The figure is kept for reruns so the code executes once per click
+                run_key = (match['code'], fingerprint)
+                if st.button("▶️ Run this now", key="run_instant_match"):
+                    st.session_state.pop('instant_artifact', None)
+                    _, instant_vars = build_execution_context(df, fingerprint, prompt_to_use)
+                    instant_artifact = execute_and_render(match['code'], df, match['model_name'], instant_vars)
+                    if instant_artifact:
+                        st.session_state['instant_artifact'] = (run_key, instant_artifact)
+                elif st.session_state.get('instant_artifact', (None,))[0] == run_key:
+                    render_artifact(*st.session_state['instant_artifact'][1])
+
+        # Restore earlier iterations without calling the models again
+        try:
+            history = get_history_store().list_iterations(history_user_id)
+        except Exception as e:
+            history = []
+            print(f"Result history error: {e}")
+        if history:
+            with st.expander(f"🕘 Result History ({len(history)} iterations)", expanded=False):
+                history_labels = {
+                    iteration: f"#{iteration} · {datetime.fromtimestamp(created_at):%Y-%m-%d %H:%M} · {prompt[:80]}"
+                    for iteration, prompt, created_at in history
+                }
+                restore_iteration = st.selectbox(
+                    "Choose an iteration:",
+                    list(history_labels.keys()),
+                    format_func=history_labels.get,
+                    key="history_iteration_select"
+                )
+                if st.button("♻️ Restore Iteration"):
+                    restored_prompt, restored_results = get_history_store().restore_iteration(
+                        history_user_id, restore_iteration
+                    )
+                    if restored_results:
+                        st.session_state['all_results'] = restored_results
+                        st.session_state['current_prompt'] = restored_prompt
+                        st.session_state['history_iteration'] = restore_iteration
+                        st.rerun()
+                    else:
+                        st.warning("This iteration is no longer available.")
+
         # Generate Visualizations from All LLM Models
         st.subheader("◆ Generate Visualizations from All LLM Models")
         st.info(
@@ -328,6 +591,15 @@ def handle_prompt_tab():
             "available AI models simultaneously."
         )
         
+        # Opt-in: profile each model's code when it is executed
+        profile_execution = st.checkbox(
+            "🔬 Profile code execution",
+            value=False,
+            key="profile_execution",
+            help="Records wall/CPU time, peak memory and the slowest functions of each "
+                 "model's code, and stores them with your feedback."
+        )
+        
         # Clear results button
         col1, col2 = st.columns([1, 1])
         with col1:
@@ -336,6 +608,7 @@ def handle_prompt_tab():
             if st.button("🗑️ Clear Results"):
                 st.session_state['all_results'] = {}
                 st.session_state['current_prompt'] = ""
+                st.session_state['history_iteration'] = None
                 st.rerun()
         
         if generate_clicked and prompt_to_use:
@@ -346,19 +619,8 @@ def handle_prompt_tab():
                 st.session_state['current_prompt'] = prompt_to_use
                 
                 # Prepare the prompt for LLM
-                columns_str = ", ".join(df.columns)
-                df_head_str = df.head().to_string(index=False)
-                prompt = f"""Create a Python visualization for this request: {prompt_to_use}
-
-DataFrame 'df' has columns: {columns_str}
-Sample data:
-{df_head_str}
-
-Requirements:
-- Use matplotlib, seaborn, or plotly
-- Include plt.show() or fig.show()
-- Return only Python code
-- Use pandas for data manipulation"""
+                dataset_context, request_prompt = build_prompt_parts(df, fingerprint, prompt_to_use)
+                complexity = None if use_custom_prompt else details['Complexity']
                 
                 # Store results for all models
                 all_results = {}
@@ -368,93 +630,32 @@ Requirements:
                 
                 # Generate from all models simultaneously
                 with st.spinner("Generating visualizations from all AI models..."):
-                    for model_name, model_id in AVAILABLE_MODELS.items():
-                        try:
-                            st.write(f"🔄 Generating with {model_name}...")
-                            
-                            # Resolve model id
-                            selected_model_id = model_id
-
-                            # OpenRouter API call
-                            url = f"{OPENROUTER_BASE_URL}/chat/completions"
-                            headers = {
-                                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                                "Content-Type": "application/json",
-                                "HTTP-Referer": "https://github.com/ra90x/PromptVix",
-                                "X-Title": "PromptVix"
-                            }
-                            payload = {
-                                "model": selected_model_id,
-                                "messages": [
-                                    {
-                                        "role": "system", 
-                                        "content": (
-                                            "You are a Python code generator. "
-                                            "Return only executable Python code, "
-                                            "no explanations."
-                                        )
-                                    },
-                                    {"role": "user", "content": prompt}
-                                ],
-                                "max_tokens": MAX_TOKENS,
-                                "temperature": TEMPERATURE
-                            }
-                            
-                            response = requests.post(url, headers=headers, json=payload)
-                            
-                            if response.status_code == 200:
-                                response_data = response.json()
-                                if 'choices' in response_data and response_data['choices']:
-                                    code = response_data['choices'][0]['message']['content']
-                                    # Clean the code
-                                    code = re.sub(
-                                        r"^```(?:python)?\s*", 
-                                        "", 
-                                        code.strip(), 
-                                        flags=re.IGNORECASE
-                                    )
-                                    code = re.sub(r"\s*```$", "", code, flags=re.IGNORECASE)
-                                    
-                                    if code and code.strip():
-                                        all_results[model_name] = {
-                                            'code': code,
-                                            'model_id': model_id,
-                                            'success': True,
-                                            'prompt': prompt_to_use
-                                        }
-                                    else:
-                                        all_results[model_name] = {
-                                            'code': f"Error: {model_name} returned empty code",
-                                            'model_id': model_id,
-                                            'success': False,
-                                            'prompt': prompt_to_use
-                                        }
-                                else:
-                                    all_results[model_name] = {
-                                        'code': f"Error: {model_name} returned no choices",
-                                        'model_id': model_id,
-                                        'success': False,
-                                        'prompt': prompt_to_use
-                                    }
-                            else:
-                                # Include brief response body for debugging
-                                body_snippet = response.text[:300] if response.text else ""
-                                all_results[model_name] = {
-                                    'code': f"API Error: {response.status_code} - {body_snippet}",
-                                    'model_id': selected_model_id,
-                                    'success': False,
-                                    'prompt': prompt_to_use
-                                }
-                        except Exception as e:
-                            all_results[model_name] = {
-                                'code': f"Exception: {str(e)}",
-                                'model_id': selected_model_id if 'selected_model_id' in locals() else model_id,
-                                'success': False,
-                                'prompt': prompt_to_use
-                            }
+                    if GENERATION_SERVICE_URL:
+                        all_results = generate_with_service(
+                            df, fingerprint, dataset_context, request_prompt, prompt_to_use, complexity,
+                            profile=profile_execution
+                        )
+                    else:
+                        for model_name, result, prefetched in iter_generations(
+                            AVAILABLE_MODELS, dataset_context, request_prompt, prompt_to_use, complexity,
+                            owner=get_speculation_owner(st.session_state)
+                        ):
+                            st.write(f"{'⚡' if prefetched else '✅'} {model_name} finished"
+                                     f"{' (prefetched)' if prefetched else ''}")
+                            all_results[model_name] = result
+                # Results of this selection are consumed; only the next
+                # selection change starts a new speculation
+                cancel_speculation(st.session_state, forget=False)
                 
                 # Store results in session state for persistence
                 st.session_state['all_results'] = all_results
+                try:
+                    st.session_state['history_iteration'] = get_history_store().record_iteration(
+                        history_user_id, prompt_to_use, all_results
+                    )
+                except Exception as e:
+                    st.session_state['history_iteration'] = None
+                    print(f"Result history error: {e}")
                 st.success(
                     "✅ All models have completed! Results are displayed below "
                     "and will persist until cleared."
@@ -466,6 +667,30 @@ Requirements:
             st.subheader("📊 Generated Visualizations")
             st.info(f"**Current Prompt:** {st.session_state['current_prompt']}")
             
+            # Follow-up instructions change the existing code instead of
+            # regenerating it from scratch
+            with st.form("refine_all_form", clear_on_submit=True):
+                refine_instruction = st.text_input(
+                    "✏️ Refine all visualizations:",
+                    placeholder="e.g., 'Sort the bars descending and use a log scale'"
+                )
+                if st.form_submit_button("🔁 Refine All") and refine_instruction.strip():
+                    st.session_state['pending_refinement'] = (
+                        list(st.session_state['all_results'].keys()), refine_instruction.strip()
+                    )
+            
+            pending_refinement = st.session_state.pop('pending_refinement', None)
+            if pending_refinement:
+                refine_models, refine_instruction = pending_refinement
+                with st.spinner(f"Refining {', '.join(refine_models)}..."):
+                    changed = refine_results(df, fingerprint, refine_models, refine_instruction, history_user_id)
+                if changed:
+                    st.success(f"✅ Refined: {', '.join(changed)}")
+            
+            _, result_vars = build_execution_context(
+                df, fingerprint, st.session_state['current_prompt']
+            )
+            
             # Create tabs for each model (names only, no logos)
             model_names = list(st.session_state['all_results'].keys())
             tabs = st.tabs(model_names)
@@ -491,37 +716,71 @@ Requirements:
                     st.markdown(f"## 🤖 {model_name}")
                     
                     st.info(f"**Model ID:** {result['model_id']}")
+                    if result.get('usage'):
+                        usage = result['usage']
+                        st.caption(
+                            f"Tokens: {usage['prompt_tokens']} input "
+                            f"({usage['cached_tokens']} cached), "
+                            f"{usage['completion_tokens']} output"
+                        )
                     
                     if result['success']:
                         # Display generated code
                         st.subheader("📝 Generated Python Code:")
                         st.code(result['code'], language="python")
                         
-                        # Execute and display visualization
-                        try:
-                            plt.figure()
-                            exec_code = result['code'].replace("plt.show()", "").replace("fig.show()", "")
-                            
-                            global_vars = {
-                                'plt': plt,
-                                'pd': pd,
-                                'df': df,
-                                'go': go
-                            }
-                            
-                            exec(exec_code, global_vars, global_vars)
-                            
-                            st.subheader("🎨 Generated Visualization:")
-                            if 'fig' in global_vars and isinstance(global_vars['fig'], go.Figure):
-                                st.plotly_chart(global_vars['fig'])
+                        # Reuse the stored figure when it was drawn from this dataset
+                        artifact = None
+                        # Execute again when a profile was asked for but not yet recorded
+                        needs_profile = profile_execution and not result.get('profile')
+                        if result.get('artifact_hash') and result.get('artifact_fingerprint') == fingerprint \
+                                and not needs_profile:
+                            artifact = get_history_store().get_blob(result['artifact_hash'])
+                        if artifact:
+                            render_artifact(*artifact)
+                        else:
+                            if result.get('artifact') and result.get('artifact_fingerprint') == fingerprint \
+                                    and not needs_profile:
+                                # Rendered by the generation service
+                                artifact = result.pop('artifact')
+                                render_artifact(*artifact)
+                            elif result.get('render_error') and result.get('artifact_fingerprint') == fingerprint \
+                                    and not needs_profile:
+                                # Failed on the generation service; running it here would fail the same way
+                                st.error(f"Error executing code from {model_name}: {result['render_error']}")
                             else:
-                                st.pyplot(plt.gcf())
-                            
-                            plt.close('all')
-                            
-                        except Exception as e:
-                            st.error(f"Error executing code from {model_name}: {e}")
-                            plt.close('all')
+                                # Execute and display visualization
+                                profiler = ExecutionProfiler() if profile_execution else None
+                                artifact = execute_and_render(
+                                    result['code'], df, model_name, result_vars, profiler
+                                )
+                                if profiler is not None and profiler.summary:
+                                    result['profile'] = profiler.summary
+                            history_iteration = st.session_state['history_iteration']
+                            if artifact and history_iteration:
+                                try:
+                                    result['artifact_hash'] = get_history_store().attach_artifact(
+                                        history_user_id, history_iteration, model_name,
+                                        *artifact, fingerprint
+                                    )
+                                    result['artifact_fingerprint'] = fingerprint
+                                except Exception as e:
+                                    print(f"Result history error: {e}")
+                        if result.get('profile'):
+                            render_profile(result['profile'])
+                        
+                        if result.get('refinements'):
+                            st.caption("Refinements: " + " → ".join(
+                                refinement['instruction'] for refinement in result['refinements']
+                            ))
+                        with st.expander(f"✏️ Refine {model_name} only", expanded=False):
+                            with st.form(f"refine_form_{model_name}", clear_on_submit=True):
+                                model_instruction = st.text_input("Follow-up instruction:")
+                                if st.form_submit_button("🔁 Refine") and model_instruction.strip():
+                                    st.session_state['pending_refinement'] = (
+                                        [model_name], model_instruction.strip()
+                                    )
+                                    st.rerun()
                     else:
                         # Show error message if the model failed
                         st.error(f"❌ {result['code']}")
@@ -561,12 +820,22 @@ Requirements:
                             visual_insightfulness = st.slider("Visual Insightfulness - Did the visualization help you gain useful insights or notice patterns in the data? (1=Low, 5=High)", 1, 5, 3)
                             business_relevance = st.slider("Business Relevance - How relevant is the visualization to the business problem? (1=Low, 5=High)", 1, 5, 3)
                             
-                            # New field: Iteration Count
+                            # New field: Iteration Count (prefilled from the result history)
+                            suggested_iterations = 1
+                            if st.session_state['history_iteration']:
+                                try:
+                                    suggested_iterations = get_history_store().count_prompt_iterations(
+                                        history_user_id,
+                                        result.get('prompt', st.session_state['current_prompt']),
+                                        st.session_state['history_iteration']
+                                    )
+                                except Exception as e:
+                                    print(f"Result history error: {e}")
                             iteration_count = st.number_input(
                                 "Iteration Count - How many iterations did it take you to get the final outcome?",
                                 min_value=1,
                                 max_value=20,
-                                value=1,
+                                value=min(suggested_iterations, 20),
                                 step=1,
                                 help="Enter the number of attempts or refinements needed"
                             )
@@ -615,10 +884,16 @@ Requirements:
                                         iteration_count=iteration_count,
                                         positive_outcomes=positive_outcomes_str,
                                         negative_outcomes=negative_outcomes_str,
-                                        code=result['code']
+                                        code=result['code'],
+                                        execution_profile=result.get('profile')
                                     )
                                     
                                     if feedback_result['success']:
+                                        # Make the rated code available for instant reuse
+                                        get_prompt_index().add_feedback_rows(
+                                            feedback_result['data'] or [], advance_cursor=False
+                                        )
+                                        
                                         # Update feedback count for this model
                                         feedback_count_key = f"feedback_count_{model_name}"
                                         st.session_state[feedback_count_key] = st.session_state.get(feedback_count_key, 0) + 1
@@ -0,0 +1,243 @@
+"""Delta-based refinement of generated code.
+
+A follow-up instruction is sent with the previous code as conversation
+context, and the model answers with a unified diff instead of a whole new
+script. The diff is applied and validated locally, so a refinement round
+costs a few dozen output tokens and only the changed script is re-run.
+"""
+
+import re
+
+from llm_client import build_messages, complete_with_continuations, error_result
+from token_budget import get_token_budget, record_completion_tokens
+from utils import is_code_safe
+
+# Token budget key for refinement rounds (learned separately from full generations)
+REFINEMENT = 'Refinement'
+
+REFINE_INSTRUCTION = (
+    "Change the code above as follows: {instruction}\n\n"
+    "Reply with a minimal unified diff against the code above in a single "
+    "```diff block: '@@' hunk headers, a few unchanged context lines per hunk "
+    "prefixed with a space, removed lines prefixed with '-', added lines "
+    "prefixed with '+'. No file headers and no explanations. Only if nearly "
+    "every line changes, reply with the complete code in a ```python block instead."
+)
+
+FULL_CODE_INSTRUCTION = (
+    "Your patch could not be applied ({problem}). Reply with the complete "
+    "updated code in a single ```python block instead, with no explanations."
+)
+
+HUNK_HEADER = re.compile(r"^@@")
+
+
+class PatchError(ValueError):
+    """Raised when a diff cannot be applied to the code."""
+
+
+def build_refinement_messages(dataset_context, request_prompt, previous_code, instruction):
+    """Build the conversation for a refinement round.
+
+    The system message and dataset context are the same prefix as for full
+    generations, so providers can serve them from their prompt cache.
+
+    Args:
+        dataset_context (str): Dataset columns and sample rows
+        request_prompt (str): The request the previous code was generated for
+        previous_code (str): Code being refined
+        instruction (str): The user's follow-up instruction
+
+    Returns:
+        list: Messages for the chat completions endpoint
+    """
+    return build_messages(dataset_context, request_prompt) + [
+        {"role": "assistant", "content": f"```python\n{previous_code}\n```"},
+        {"role": "user", "content": REFINE_INSTRUCTION.format(instruction=instruction)},
+    ]
+
+
+def _parse_hunks(diff_text):
+    """Split a unified diff into hunks of (old lines, new lines)."""
+    hunks = []
+    current = None
+    for line in diff_text.splitlines():
+        if line.startswith(('--- ', '+++ ', 'diff ', 'index ')):
+            continue
+        if HUNK_HEADER.match(line):
+            current = ([], [])
+            hunks.append(current)
+            continue
+        if current is None:
+            # Some models omit the first hunk header
+            if not line.startswith((' ', '-', '+')):
+                continue
+            current = ([], [])
+            hunks.append(current)
+        if line.startswith('-'):
+            current[0].append(line[1:])
+        elif line.startswith('+'):
+            current[1].append(line[1:])
+        elif line.startswith('\\'):
+            continue
+        else:
+            # Context line; a blank line inside a hunk is empty context
+            text = line[1:] if line.startswith(' ') else line
+            current[0].append(text)
+            current[1].append(text)
+    return [hunk for hunk in hunks if hunk[0] != hunk[1]]
+
+
+def _find_block(lines, block):
+    """Return every position of ``block`` in ``lines``, ignoring trailing spaces."""
+    target = [line.rstrip() for line in block]
+    stripped = [line.rstrip() for line in lines]
+    return [
+        position for position in range(len(lines) - len(block) + 1)
+        if stripped[position:position + len(block)] == target
+    ]
+
+
+def apply_unified_diff(code, diff_text):
+    """Apply a unified diff to code, locating hunks by content.
+
+    Line numbers in hunk headers are ignored because models often get them
+    wrong; each hunk's context and removed lines must appear verbatim
+    (up to trailing whitespace) exactly once, after the previous hunk.
+    Nothing is guessed: ambiguous or context-free hunks are rejected.
+
+    Args:
+        code (str): Original code
+        diff_text (str): Unified diff
+
+    Returns:
+        str: Patched code
+
+    Raises:
+        PatchError: If the diff has no hunks, or a hunk has no context,
+            does not match, matches more than once or matches out of order
+    """
+    hunks = _parse_hunks(diff_text)
+    if not hunks:
+        raise PatchError("the diff contains no changes")
+    lines = code.splitlines()
+    position = 0
+    for number, (old, new) in enumerate(hunks, start=1):
+        if not old:
+            raise PatchError(f"hunk {number} has no context lines")
+        matches = _find_block(lines, old)
+        if not matches:
+            raise PatchError(f"hunk {number} does not match the previous code")
+        if len(matches) > 1:
+            raise PatchError(f"hunk {number} matches {len(matches)} places in the previous code")
+        found = matches[0]
+        if found < position:
+            raise PatchError(f"hunk {number} is out of order")
+        lines[found:found + len(old)] = new
+        position = found + len(new)
+    return "\n".join(lines) + "\n"
+
+
+def validate_code(code, previous_code=None):
+    """Check that patched code compiles and passes the safety filter.
+
+    Args:
+        code (str): Code to validate
+        previous_code (str, optional): Code before the patch; the safety
+            filter only rejects patterns the patch introduced
+
+    Returns:
+        str: Error message, or None if the code is valid
+    """
+    try:
+        compile(code, '<refined>', 'exec')
+    except SyntaxError as e:
+        return f"patched code does not compile: {e.msg} (line {e.lineno})"
+    if not is_code_safe(code) and (previous_code is None or is_code_safe(previous_code)):
+        return "patched code uses disallowed operations"
+    return None
+
+
+def _extract_reply(content):
+    """Return ('diff' or 'python', body) from a model reply."""
+    match = re.search(r"```(diff|python)?[ \t]*\n(.*?)(?:\n```|\Z)", content, flags=re.DOTALL | re.IGNORECASE)
+    if match:
+        kind = (match.group(1) or '').lower()
+        body = match.group(2)
+    else:
+        kind, body = '', content.strip()
+    if kind not in ('diff', 'python'):
+        kind = 'diff' if re.search(r"^@@", body, flags=re.MULTILINE) else 'python'
+    return kind, body
+
+
+def refine_code(model_name, model_id, dataset_context, request_prompt, previous_code, instruction,
+                prompt_to_use):
+    """Refine one model's code with a follow-up instruction.
+
+    Args:
+        model_name (str): Display name of the model
+        model_id (str): OpenRouter model identifier
+        dataset_context (str): Dataset columns and sample rows (cacheable prefix)
+        request_prompt (str): The request the previous code was generated for
+        previous_code (str): Code being refined
+        instruction (str): The user's follow-up instruction
+        prompt_to_use (str): The user's visualization request
+
+    Returns:
+        dict: Result like ``generate_code`` plus 'patch' (the applied diff,
+            or None if the model sent complete code)
+    """
+    messages = build_refinement_messages(dataset_context, request_prompt, previous_code, instruction)
+    max_tokens = get_token_budget(model_id, REFINEMENT)
+    try:
+        content, usage, error = complete_with_continuations(model_name, model_id, messages, max_tokens)
+        if error:
+            return error_result(error, model_id, prompt_to_use)
+        # The refinement budget learns the length of first replies only
+        record_completion_tokens(model_id, REFINEMENT, usage['completion_tokens'])
+        usage = dict(usage)
+
+        kind, body = _extract_reply(content)
+        patch = None
+        if kind == 'diff':
+            try:
+                code = apply_unified_diff(previous_code, body)
+                patch = body
+            except PatchError as e:
+                # Ask for the complete code rather than guess where the patch goes
+                messages = messages + [
+                    {"role": "assistant", "content": content},
+                    {"role": "user", "content": FULL_CODE_INSTRUCTION.format(problem=e)},
+                ]
+                content, retry_usage, error = complete_with_continuations(
+                    model_name, model_id, messages, get_token_budget(model_id, None)
+                )
+                for key in usage:
+                    usage[key] += retry_usage[key]
+                if error:
+                    return error_result(error, model_id, prompt_to_use)
+                kind, body = _extract_reply(content)
+                if kind != 'python':
+                    return error_result(f"Error: {model_name} sent a patch that could not be applied ({e})",
+                                         model_id, prompt_to_use)
+        if patch is None:
+            code = body
+        if not code.strip():
+            return error_result(f"Error: {model_name} returned empty code", model_id, prompt_to_use)
+
+        problem = validate_code(code, previous_code)
+        if problem:
+            return error_result(f"Error: {model_name} refinement rejected, {problem}",
+                                 model_id, prompt_to_use)
+
+        return {
+            'code': code,
+            'model_id': model_id,
+            'success': True,
+            'prompt': prompt_to_use,
+            'usage': usage,
+            'patch': patch,
+        }
+    except Exception as e:
+        return error_result(f"Exception: {str(e)}", model_id, prompt_to_use)
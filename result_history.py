@@ -0,0 +1,372 @@
+"""Per-user result history kept outside the Streamlit session.
+
+Each Generate run is stored as an iteration: the prompt plus, per model, the
+code and a pointer to the rendered figure. Code and figures are stored once
+by content hash, so re-running identical code costs no extra space.
+Least-recently-used iterations are evicted per user and when the store
+exceeds its size cap.
+"""
+
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from config import CACHE_DIR, HISTORY_MAX_BYTES, HISTORY_MAX_ITERATIONS_PER_USER
+
+# Iterations read per step when the size cap forces eviction
+EVICTION_BATCH = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    user_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (user_id, iteration)
+);
+CREATE TABLE IF NOT EXISTS results (
+    user_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    model_name TEXT NOT NULL,
+    model_id TEXT,
+    success INTEGER NOT NULL,
+    code_hash TEXT NOT NULL,
+    artifact_hash TEXT,
+    dataset_fingerprint TEXT,
+    PRIMARY KEY (user_id, iteration, model_name)
+);
+CREATE INDEX IF NOT EXISTS iterations_lru ON iterations (last_access);
+CREATE INDEX IF NOT EXISTS results_code ON results (code_hash);
+CREATE INDEX IF NOT EXISTS results_artifact ON results (artifact_hash);
+CREATE TABLE IF NOT EXISTS store_size (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_size (id, bytes) SELECT 1, COALESCE(SUM(size), 0) FROM blobs;
+CREATE TABLE IF NOT EXISTS user_iterations (
+    user_id TEXT PRIMARY KEY,
+    last_iteration INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO user_iterations (user_id, last_iteration)
+    SELECT user_id, MAX(iteration) FROM iterations GROUP BY user_id;
+"""
+
+
+def content_hash(data):
+    """Return the content address for a blob.
+
+    Args:
+        data (bytes): Blob contents
+
+    Returns:
+        str: Hex digest
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class ResultHistoryStore:
+    """SQLite-backed history of generation results with LRU eviction."""
+
+    def __init__(self, path, max_bytes=HISTORY_MAX_BYTES, max_iterations_per_user=HISTORY_MAX_ITERATIONS_PER_USER):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_iterations_per_user = max_iterations_per_user
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _put_blob(self, conn, kind, data):
+        """Store a blob once under its content hash and return the hash."""
+        blob_hash = content_hash(data)
+        compressed = zlib.compress(data, 6)
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, kind, data, size) VALUES (?, ?, ?, ?)",
+            (blob_hash, kind, compressed, len(compressed))
+        ).rowcount
+        if inserted:
+            conn.execute("UPDATE store_size SET bytes = bytes + ? WHERE id = 1", (len(compressed),))
+        return blob_hash
+
+    def get_blob(self, blob_hash):
+        """Load a blob by hash.
+
+        Args:
+            blob_hash (str): Content hash
+
+        Returns:
+            tuple: (kind, bytes), or None if the blob was evicted
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT kind, data FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        if row is None:
+            return None
+        return row[0], zlib.decompress(row[1])
+
+    def record_iteration(self, user_id, prompt, results):
+        """Store a Generate run as the user's next iteration.
+
+        Args:
+            user_id (str): Stable per-user identifier
+            prompt (str): The user's visualization request
+            results (dict): Model name to result dict ('code', 'model_id', 'success');
+                results that already carry 'artifact_hash' and
+                'artifact_fingerprint' keep pointing at that figure
+
+        Returns:
+            int: The new iteration number; numbers are never reused, even
+                after every earlier iteration was evicted
+        """
+        now = time.time()
+        with self._write_lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO user_iterations (user_id, last_iteration) VALUES (?, 0)", (user_id,)
+            )
+            conn.execute(
+                "UPDATE user_iterations SET last_iteration = last_iteration + 1 WHERE user_id = ?", (user_id,)
+            )
+            iteration = conn.execute(
+                "SELECT last_iteration FROM user_iterations WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO iterations (user_id, iteration, prompt, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, iteration, prompt, now, now)
+            )
+            for model_name, result in results.items():
+                code_hash = self._put_blob(conn, 'code', result['code'].encode('utf-8'))
+                conn.execute(
+                    "INSERT INTO results (user_id, iteration, model_name, model_id, success, code_hash, "
+                    "artifact_hash, dataset_fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, iteration, model_name, result.get('model_id'), int(result['success']), code_hash,
+                     result.get('artifact_hash'), result.get('artifact_fingerprint'))
+                )
+            self._evict(conn, user_id, iteration)
+        return iteration
+
+    def attach_artifact(self, user_id, iteration, model_name, kind, data, fingerprint):
+        """Attach a rendered figure to a stored result.
+
+        Args:
+            user_id (str): Stable per-user identifier
+            iteration (int): Iteration number
+            model_name (str): Model the figure belongs to
+            kind (str): 'plotly_json' or 'png'
+            data (bytes): Serialized figure
+            fingerprint (str): Fingerprint of the dataset the figure was drawn from
+
+        Returns:
+            str: Content hash of the artifact
+        """
+        with self._write_lock, self._connect() as conn:
+            artifact_hash = self._put_blob(conn, kind, data)
+            previous = conn.execute(
+                "SELECT artifact_hash FROM results WHERE user_id = ? AND iteration = ? AND model_name = ?",
+                (user_id, iteration, model_name)
+            ).fetchone()
+            conn.execute(
+                "UPDATE results SET artifact_hash = ?, dataset_fingerprint = ? "
+                "WHERE user_id = ? AND iteration = ? AND model_name = ?",
+                (artifact_hash, fingerprint, user_id, iteration, model_name)
+            )
+            if previous and previous[0] and previous[0] != artifact_hash:
+                self._release_blobs(conn, {previous[0]})
+            if previous is None:
+                # The iteration was evicted meanwhile; the new blob is unreferenced
+                self._release_blobs(conn, {artifact_hash})
+            self._evict(conn, user_id, iteration)
+        return artifact_hash
+
+    def list_iterations(self, user_id):
+        """List a user's stored iterations, newest first.
+
+        Args:
+            user_id (str): Stable per-user identifier
+
+        Returns:
+            list: (iteration, prompt, created_at) tuples
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT iteration, prompt, created_at FROM iterations "
+                "WHERE user_id = ? ORDER BY iteration DESC",
+                (user_id,)
+            ).fetchall()
+
+    def count_prompt_iterations(self, user_id, prompt, up_to):
+        """Count how many runs of the same prompt led up to an iteration.
+
+        Args:
+            user_id (str): Stable per-user identifier
+            prompt (str): The visualization request
+            up_to (int): Last iteration to include
+
+        Returns:
+            int: Number of iterations with this prompt (at least 1)
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM iterations WHERE user_id = ? AND prompt = ? AND iteration <= ?",
+                (user_id, prompt, up_to)
+            ).fetchone()
+        return max(row[0], 1)
+
+    def restore_iteration(self, user_id, iteration):
+        """Load an iteration's results without calling any model.
+
+        Args:
+            user_id (str): Stable per-user identifier
+            iteration (int): Iteration number to restore
+
+        Returns:
+            tuple: (prompt, results dict in the session 'all_results' format),
+                or (None, {}) if the iteration was evicted
+        """
+        with self._write_lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT prompt FROM iterations WHERE user_id = ? AND iteration = ?",
+                (user_id, iteration)
+            ).fetchone()
+            if row is None:
+                return None, {}
+            prompt = row[0]
+            conn.execute(
+                "UPDATE iterations SET last_access = ? WHERE user_id = ? AND iteration = ?",
+                (time.time(), user_id, iteration)
+            )
+            rows = conn.execute(
+                "SELECT r.model_name, r.model_id, r.success, b.data, r.artifact_hash, r.dataset_fingerprint "
+                "FROM results r JOIN blobs b ON b.hash = r.code_hash "
+                "WHERE r.user_id = ? AND r.iteration = ? ORDER BY r.rowid",
+                (user_id, iteration)
+            ).fetchall()
+
+        results = {}
+        for model_name, model_id, success, code_data, artifact_hash, fingerprint in rows:
+            results[model_name] = {
+                'code': zlib.decompress(code_data).decode('utf-8'),
+                'model_id': model_id,
+                'success': bool(success),
+                'prompt': prompt,
+                'artifact_hash': artifact_hash,
+                'artifact_fingerprint': fingerprint,
+            }
+        return prompt, results
+
+    def _evict(self, conn, user_id, current):
+        """Apply the per-user iteration cap and the global size cap.
+
+        Only the evicted iterations and the blobs they release are touched,
+        so the cost follows the change rather than the size of the store.
+        The user's current iteration is never evicted, even if it alone
+        exceeds the size cap.
+
+        Args:
+            conn (sqlite3.Connection): Open connection
+            user_id (str): User whose iteration was just written
+            current (int): That iteration's number
+        """
+        over_cap = conn.execute(
+            "SELECT iteration FROM iterations WHERE user_id = ? AND iteration != ? "
+            "ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+            (user_id, current, max(self.max_iterations_per_user - 1, 0))
+        ).fetchall()
+        for (iteration,) in over_cap:
+            self._delete_iteration(conn, user_id, iteration)
+
+        total = conn.execute("SELECT bytes FROM store_size WHERE id = 1").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk the LRU index oldest first, a small batch at a time
+        while total > self.max_bytes:
+            oldest = conn.execute(
+                "SELECT user_id, iteration FROM iterations "
+                "WHERE NOT (user_id = ? AND iteration = ?) ORDER BY last_access LIMIT ?",
+                (user_id, current, EVICTION_BATCH)
+            ).fetchall()
+            if not oldest:
+                break
+            for oldest_user_id, iteration in oldest:
+                total -= self._delete_iteration(conn, oldest_user_id, iteration)
+                if total <= self.max_bytes:
+                    break
+
+    def _delete_iteration(self, conn, user_id, iteration):
+        """Delete one iteration and its results, releasing their blobs.
+
+        Returns:
+            int: Bytes freed
+        """
+        hashes = set()
+        for code_hash, artifact_hash in conn.execute(
+            "SELECT code_hash, artifact_hash FROM results WHERE user_id = ? AND iteration = ?",
+            (user_id, iteration)
+        ).fetchall():
+            hashes.add(code_hash)
+            if artifact_hash:
+                hashes.add(artifact_hash)
+        conn.execute("DELETE FROM results WHERE user_id = ? AND iteration = ?", (user_id, iteration))
+        conn.execute("DELETE FROM iterations WHERE user_id = ? AND iteration = ?", (user_id, iteration))
+        return self._release_blobs(conn, hashes)
+
+    def _release_blobs(self, conn, hashes):
+        """Delete the given blobs that no result points to any more.
+
+        Returns:
+            int: Bytes freed
+        """
+        freed = 0
+        for blob_hash in hashes:
+            referenced = conn.execute(
+                "SELECT 1 FROM results WHERE code_hash = ? UNION ALL "
+                "SELECT 1 FROM results WHERE artifact_hash = ? LIMIT 1",
+                (blob_hash, blob_hash)
+            ).fetchone()
+            if referenced:
+                continue
+            row = conn.execute("SELECT size FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+            if row is None:
+                continue
+            conn.execute("DELETE FROM blobs WHERE hash = ?", (blob_hash,))
+            freed += row[0]
+        if freed:
+            conn.execute("UPDATE store_size SET bytes = bytes - ? WHERE id = 1", (freed,))
+        return freed
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Return the process-wide history store.
+
+    Returns:
+        ResultHistoryStore: Shared store under the cache directory
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultHistoryStore(os.path.join(CACHE_DIR, 'history.sqlite3'))
+    return _store
@@ -0,0 +1,106 @@
+"""Shared read-only datasets for all sessions.
+
+Each dataset is loaded once per process and kept resident, keyed by its
+contents, instead of being unpickled into a fresh copy on every rerun.
+Code that needs its own ``df`` (generated code run through ``exec``) gets
+an isolated view: a shallow copy under pandas copy-on-write, so nothing is
+copied until the code writes, or a deep copy where copy-on-write is not
+available.
+"""
+
+import hashlib
+import io
+from dataclasses import dataclass
+
+import pandas as pd
+import streamlit as st
+
+from utils import dataset_fingerprint
+
+
+def enable_copy_on_write():
+    """Turn on pandas copy-on-write for this process if supported.
+
+    Returns:
+        bool: True if copy-on-write is active
+    """
+    major = int(pd.__version__.split('.')[0])
+    if major >= 3:
+        return True
+    if major < 2:
+        # The 1.5 implementation is experimental and incomplete
+        return False
+    pd.set_option('mode.copy_on_write', True)
+    return True
+
+
+COPY_ON_WRITE = enable_copy_on_write()
+
+
+@dataclass(frozen=True)
+class SharedDataset:
+    """A resident dataset and its content fingerprint."""
+
+    df: pd.DataFrame
+    fingerprint: str
+
+
+def isolated_view(df):
+    """Return a copy of ``df`` that can be modified without affecting others.
+
+    Args:
+        df (pd.DataFrame): Shared dataset
+
+    Returns:
+        pd.DataFrame: Shallow copy under copy-on-write, deep copy otherwise
+    """
+    return df.copy(deep=not COPY_ON_WRITE)
+
+
+def _share(df):
+    """Wrap a freshly loaded DataFrame for sharing."""
+    return SharedDataset(df=df, fingerprint=dataset_fingerprint(df))
+
+
+@st.cache_resource(show_spinner=True, max_entries=4)
+def load_shared_dataset(path):
+    """Load a CSV file once and share it across sessions and reruns.
+
+    Call ``load_shared_dataset.clear()`` to pick up a changed file.
+
+    Args:
+        path (str): CSV file path
+
+    Returns:
+        SharedDataset: Resident dataset
+    """
+    df = pd.read_csv(path, encoding='latin1')
+    df.to_csv('Superstore_Dataset.csv', encoding='utf-8', index=False)
+    return _share(df)
+
+
+@st.cache_resource(show_spinner="Reading uploaded dataset...", max_entries=8)
+def load_shared_upload(content_hash, _data):
+    """Parse uploaded CSV bytes once per distinct upload.
+
+    Args:
+        content_hash (str): Hash of the uploaded bytes (cache key)
+        _data (bytes): Uploaded file contents; excluded from hashing
+
+    Returns:
+        SharedDataset: Resident dataset
+    """
+    return _share(pd.read_csv(io.BytesIO(_data)))
+
+
+def get_shared_upload(uploaded_file):
+    """Return the resident dataset for an uploaded CSV file.
+
+    Args:
+        uploaded_file (UploadedFile): Streamlit upload
+
+    Returns:
+        SharedDataset: Resident dataset
+    """
+    data = uploaded_file.getvalue()
+    return load_shared_upload(hashlib.blake2b(data, digest_size=16).hexdigest(), data)
@@ -0,0 +1,245 @@
+"""Incremental TF-IDF index over past prompts for instant code reuse."""
+
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from config import (
+    SIMILARITY_MIN_RATING,
+    SIMILARITY_MIN_SCORE,
+    SIMILARITY_REFRESH_SECONDS,
+)
+from supabase_feedback import get_feedback_since
+
+# Results saved for failed generations carry the error message as 'code'
+ERROR_PREFIXES = ("Error:", "API Error:", "Exception:")
+
+# Negative outcome that marks code which did not run
+EXECUTION_FAILURE_OUTCOME = "3: Code Execution Failures"
+
+SUBSCRIPT_PATTERN = re.compile(r"\[\s*['\"]([^'\"]+)['\"]\s*\]")
+ASSIGNED_PATTERN = re.compile(r"\[\s*['\"]([^'\"]+)['\"]\s*\]\s*=(?!=)")
+DEFINED_PATTERN = re.compile(r"(?:name\s*=\s*|:\s*)['\"]([^'\"]+)['\"]")
+
+
+def normalize_prompt(prompt):
+    """Normalize a prompt for indexing (case, punctuation, whitespace).
+
+    Args:
+        prompt (str): Raw prompt text
+
+    Returns:
+        str: Normalized prompt
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", prompt.lower()))
+
+
+def tokenize(normalized):
+    """Split a normalized prompt into unigram and bigram terms."""
+    words = normalized.split()
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def is_schema_compatible(code, columns):
+    """Check whether code only references columns available in a dataset.
+
+    Column names read through subscripts (``df['Sales']``) must exist in the
+    dataset unless the code defines them itself (assignment, ``name=`` or
+    rename/aggregation mappings).
+
+    Args:
+        code (str): Previously generated Python code
+        columns (iterable): Columns of the current dataset
+
+    Returns:
+        bool: True if every referenced column is available
+    """
+    referenced = set(SUBSCRIPT_PATTERN.findall(code))
+    defined = set(ASSIGNED_PATTERN.findall(code)) | set(DEFINED_PATTERN.findall(code))
+    return not (referenced - defined - set(columns))
+
+
+class PromptSimilarityIndex:
+    """TF-IDF cosine index from normalized prompts to rated code."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._doc_ids = {}
+        self._term_counts = []
+        self._postings = defaultdict(set)
+        self._doc_freq = Counter()
+        self._solutions = []
+        self._seen_feedback = set()
+        self._last_created_at = None
+        self._last_refresh = 0.0
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def add(self, prompt, code, rating, model_name, feedback_id=None):
+        """Add one rated prompt/code pair to the index.
+
+        Args:
+            prompt (str): Visualization request the code was generated for
+            code (str): Generated Python code
+            rating (float): Mean of the human ratings (1-5)
+            model_name (str): Model that generated the code
+            feedback_id (optional): Feedback row id, used to skip duplicates
+        """
+        normalized = normalize_prompt(prompt or "")
+        if not normalized or not code or code.startswith(ERROR_PREFIXES):
+            return
+
+        with self._lock:
+            if feedback_id is not None:
+                if feedback_id in self._seen_feedback:
+                    return
+                self._seen_feedback.add(feedback_id)
+
+            doc_id = self._doc_ids.get(normalized)
+            if doc_id is None:
+                doc_id = len(self._term_counts)
+                self._doc_ids[normalized] = doc_id
+                terms = Counter(tokenize(normalized))
+                self._term_counts.append(terms)
+                self._solutions.append({'prompt': prompt, 'codes': {}})
+                for term in terms:
+                    self._postings[term].add(doc_id)
+                    self._doc_freq[term] += 1
+
+            code_hash = hashlib.sha256(code.encode('utf-8')).hexdigest()
+            solution = self._solutions[doc_id]['codes'].setdefault(
+                code_hash, {'code': code, 'model_name': model_name, 'ratings': []}
+            )
+            solution['ratings'].append(float(rating))
+
+    def add_feedback_rows(self, rows, advance_cursor=True):
+        """Add feedback table rows to the index.
+
+        Args:
+            rows (list): Feedback rows as returned by Supabase
+            advance_cursor (bool): Move the sync cursor past these rows; rows
+                saved by this process pass False so concurrent inserts from
+                other instances are still picked up by the next refresh
+        """
+        for row in rows:
+            if EXECUTION_FAILURE_OUTCOME in (row.get('neg_outcome') or ""):
+                continue
+            scores = [
+                row.get('visual_accuracy'),
+                row.get('visual_insightfulness'),
+                row.get('business_relevance'),
+            ]
+            scores = [s for s in scores if s is not None]
+            if not scores:
+                continue
+            self.add(
+                row.get('prompt'),
+                row.get('code'),
+                sum(scores) / len(scores),
+                row.get('model_name'),
+                feedback_id=row.get('id'),
+            )
+            created_at = row.get('created_at')
+            if advance_cursor and created_at and (self._last_created_at is None or created_at > self._last_created_at):
+                self._last_created_at = created_at
+
+    def refresh(self, force=False):
+        """Pull feedback created since the last sync from Supabase.
+
+        Args:
+            force (bool): Ignore the refresh interval
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < SIMILARITY_REFRESH_SECONDS:
+            return
+        self._last_refresh = now
+        self.add_feedback_rows(get_feedback_since(self._last_created_at))
+
+    def _vector(self, terms):
+        """Weight term counts by smoothed inverse document frequency."""
+        n_docs = len(self._term_counts)
+        return {
+            term: count * (math.log((1 + n_docs) / (1 + self._doc_freq[term])) + 1)
+            for term, count in terms.items()
+        }
+
+    def query(self, prompt, columns, top_k=3):
+        """Find the best-rated prior code for prompts similar to ``prompt``.
+
+        Args:
+            prompt (str): New visualization request
+            columns (iterable): Columns of the current dataset
+            top_k (int): Maximum number of matches to return
+
+        Returns:
+            list: Matches (dicts with 'prompt', 'similarity', 'code', 'rating',
+                'model_name' and 'votes'), most similar first
+        """
+        normalized = normalize_prompt(prompt or "")
+        if not normalized:
+            return []
+
+        with self._lock:
+            query_vec = self._vector(Counter(tokenize(normalized)))
+            query_norm = math.sqrt(sum(w * w for w in query_vec.values()))
+            candidates = set()
+            for term in query_vec:
+                candidates |= self._postings.get(term, set())
+
+            scored = []
+            for doc_id in candidates:
+                doc_vec = self._vector(self._term_counts[doc_id])
+                dot = sum(w * doc_vec.get(term, 0.0) for term, w in query_vec.items())
+                doc_norm = math.sqrt(sum(w * w for w in doc_vec.values()))
+                similarity = dot / (query_norm * doc_norm) if query_norm and doc_norm else 0.0
+                if similarity >= SIMILARITY_MIN_SCORE:
+                    scored.append((similarity, doc_id))
+            scored.sort(reverse=True)
+
+            matches = []
+            for similarity, doc_id in scored:
+                solution = self._solutions[doc_id]
+                ranked = sorted(
+                    solution['codes'].values(),
+                    key=lambda c: sum(c['ratings']) / len(c['ratings']),
+                    reverse=True,
+                )
+                for candidate in ranked:
+                    rating = sum(candidate['ratings']) / len(candidate['ratings'])
+                    if rating < SIMILARITY_MIN_RATING:
+                        break
+                    if is_schema_compatible(candidate['code'], columns):
+                        matches.append({
+                            'prompt': solution['prompt'],
+                            'similarity': similarity,
+                            'code': candidate['code'],
+                            'rating': rating,
+                            'model_name': candidate['model_name'],
+                            'votes': len(candidate['ratings']),
+                        })
+                        break
+                if len(matches) >= top_k:
+                    break
+            return matches
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prompt_index():
+    """Return the process-wide prompt index, syncing new feedback first.
+
+    Returns:
+        PromptSimilarityIndex: Shared index
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PromptSimilarityIndex()
+    _index.refresh()
+    return _index
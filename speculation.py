@@ -0,0 +1,212 @@
+"""Speculative prefetch of generations for the selected business problem.
+
+While the analyst reads the problem description, every model is asked for
+code in the background and the results are parked in the completion cache
+under the session's id, so the Generate click of that session can usually
+be answered without waiting. Each session has at most one speculation in
+flight: a newer selection cancels the previous one and starts sending only
+after the previous thread has finished its last upstream request. All
+sessions share a daily budget of upstream generations, persisted so that
+restarts do not reset it.
+"""
+
+import json
+import os
+import threading
+import uuid
+from datetime import date
+
+from config import CACHE_DIR, SPECULATIVE_DAILY_BUDGET
+from llm_client import completion_cache_key, discard_completion, generate_code, store_completion
+
+BUDGET_PATH = os.path.join(CACHE_DIR, 'speculative_budget.json')
+
+_budget_lock = threading.Lock()
+_budget = None
+
+
+def _load_budget():
+    """Load today's persisted budget usage, once per process."""
+    global _budget
+    if _budget is None:
+        _budget = {'day': None, 'used': 0}
+        try:
+            with open(BUDGET_PATH, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            _budget = {'day': date.fromisoformat(stored['day']), 'used': int(stored['used'])}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    return _budget
+
+
+def _save_budget(budget):
+    """Persist budget usage so it survives restarts."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{BUDGET_PATH}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'day': budget['day'].isoformat(), 'used': budget['used']}, f)
+        os.replace(tmp_path, BUDGET_PATH)
+    except OSError as e:
+        print(f"Could not persist speculative budget: {e}")
+
+
+def reserve_budget():
+    """Reserve one speculative generation from today's budget.
+
+    Returns:
+        bool: True if the generation may be sent
+    """
+    with _budget_lock:
+        budget = _load_budget()
+        today = date.today()
+        if budget['day'] != today:
+            budget['day'] = today
+            budget['used'] = 0
+        if budget['used'] >= SPECULATIVE_DAILY_BUDGET:
+            return False
+        budget['used'] += 1
+        _save_budget(budget)
+        return True
+
+
+def get_budget_stats():
+    """Return today's speculative budget usage.
+
+    Returns:
+        dict: 'used' and 'limit' generation counts
+    """
+    with _budget_lock:
+        budget = _load_budget()
+        used = budget['used'] if budget['day'] == date.today() else 0
+    return {'used': used, 'limit': SPECULATIVE_DAILY_BUDGET}
+
+
+def get_speculation_owner(session_state):
+    """Return the id under which a session's prefetched results are cached.
+
+    Args:
+        session_state (MutableMapping): Streamlit session state
+
+    Returns:
+        str: Per-session identifier
+    """
+    if 'speculation_owner' not in session_state:
+        session_state['speculation_owner'] = uuid.uuid4().hex
+    return session_state['speculation_owner']
+
+
+class Speculation:
+    """Background generation of one prompt across all models."""
+
+    def __init__(self, key, models, dataset_context, request_prompt, prompt_to_use, complexity, owner,
+                 previous=None):
+        self.key = key
+        self.owner = owner
+        self.models = dict(models)
+        self.dataset_context = dataset_context
+        self.request_prompt = request_prompt
+        self.prompt_to_use = prompt_to_use
+        self.complexity = complexity
+        self.cache_keys = {
+            model_name: completion_cache_key(model_id, dataset_context, request_prompt, complexity, owner)
+            for model_name, model_id in self.models.items()
+        }
+        self.prefetched = set()
+        # Cancelled speculation of the same session that may still be waiting on upstream
+        self._previous = previous
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def join(self):
+        """Wait until the background thread has exited."""
+        self._thread.join()
+
+    def cancel(self):
+        """Stop issuing requests and drop results that were not used.
+
+        A request already sent upstream cannot be aborted, but its result is
+        discarded instead of being cached.
+        """
+        self._cancelled.set()
+        for cache_key in self.cache_keys.values():
+            discard_completion(cache_key)
+
+    def _run(self):
+        if self._previous is not None:
+            self._previous.join()
+            self._previous = None
+        for model_name, model_id in self.models.items():
+            if self._cancelled.is_set() or not reserve_budget():
+                return
+            try:
+                result = generate_code(
+                    model_name, model_id, self.dataset_context, self.request_prompt,
+                    self.prompt_to_use, complexity=self.complexity
+                )
+            except Exception as e:
+                print(f"Speculative generation error for {model_name}: {e}")
+                continue
+            if self._cancelled.is_set():
+                return
+            store_completion(self.cache_keys[model_name], result)
+            if result['success']:
+                self.prefetched.add(model_name)
+
+
+def speculate(session_state, key, models, dataset_context, request_prompt, prompt_to_use, complexity):
+    """Start a speculation for a selection unless it is already running.
+
+    A speculation for a different selection is cancelled first. The new one
+    waits in the background until the cancelled thread has exited, so at
+    most one upstream request per session is in flight.
+
+    Args:
+        session_state (MutableMapping): Streamlit session state
+        key (tuple): Identifies the selection (dataset fingerprint, problem)
+        models (dict): Model name to OpenRouter model id
+        dataset_context (str): Dataset columns and sample rows
+        request_prompt (str): Request-specific part of the prompt
+        prompt_to_use (str): The visualization request
+        complexity (str): Problem complexity
+
+    Returns:
+        Speculation: The speculation for ``key``
+    """
+    current = session_state.get('speculation')
+    if current is not None and current.key == key:
+        return current
+    cancel_speculation(session_state)
+    previous = session_state.pop('speculation_previous', None)
+    speculation = Speculation(
+        key, models, dataset_context, request_prompt, prompt_to_use, complexity,
+        get_speculation_owner(session_state),
+        previous=previous if previous is not None and previous.is_running() else None
+    )
+    session_state['speculation'] = speculation.start()
+    return speculation
+
+
+def cancel_speculation(session_state, forget=True):
+    """Cancel the session's speculation, if any.
+
+    Args:
+        session_state (MutableMapping): Streamlit session state
+        forget (bool): Also forget the selection; when False the same
+            selection is not speculated on again
+    """
+    current = session_state.get('speculation')
+    if current is None:
+        return
+    current.cancel()
+    if forget:
+        del session_state['speculation']
+        # Its last upstream request may still be running; the next speculation waits for it
+        session_state['speculation_previous'] = current
@@ -35,7 +35,8 @@ def save_feedback_to_supabase(
     iteration_count: int,
     positive_outcomes: str,
     negative_outcomes: str,
-    code: str = None
+    code: str = None,
+    execution_profile: dict = None
 ) -> dict:
     """
     Save feedback to Supabase feedback table.
@@ -52,6 +53,8 @@ def save_feedback_to_supabase(
         negative_outcomes: Comma-separated negative outcomes
         comment: Optional comment
         code: Generated code
+        execution_profile: Optional profile of the code's execution, stored
+            in the 'execution_profile' (jsonb) column
     
     Returns:
         dict: Response from Supabase
@@ -80,6 +83,9 @@ def save_feedback_to_supabase(
             "session_id": session_id,
             "created_at": created_at
         }
+        # Only sent when profiling was on, so tables without the column still work
+        if execution_profile is not None:
+            feedback_data["execution_profile"] = execution_profile
 
         # Insert into feedback table
         response = supabase.table("feedback").insert(feedback_data).execute()
@@ -125,6 +131,28 @@ def get_feedback_analysis():
         return []
 
 
+def get_feedback_since(created_after: str = None) -> list:
+    """
+    Get feedback rows created at or after a timestamp, oldest first.
+    
+    Args:
+        created_after: Timestamp in the created_at format (inclusive); None returns all rows
+    
+    Returns:
+        list: Feedback rows, or an empty list on error
+    """
+    try:
+        supabase = get_supabase_client()
+        query = supabase.table("feedback").select("*")
+        if created_after:
+            # Rows from the cursor's own second are fetched again; callers skip seen ids
+            query = query.gte("created_at", created_after)
+        response = query.order("created_at").execute()
+        return response.data or []
+    except Exception as e:
+        return []
+
+
 if __name__ == "__main__":
     # No direct execution behavior needed
     pass
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""Per-(model, complexity) completion token budgets learned from usage."""
+
+import json
+import math
+import os
+import threading
+from collections import deque
+
+from config import (
+    CACHE_DIR,
+    DEFAULT_TOKEN_BUDGETS,
+    MAX_TOKENS,
+    MAX_TOKEN_BUDGET,
+    MIN_TOKEN_BUDGET,
+    TOKEN_BUDGET_HEADROOM,
+    TOKEN_BUDGET_MIN_SAMPLES,
+)
+
+# Number of recent completions remembered per (model, complexity)
+HISTORY_SIZE = 50
+
+STATS_PATH = os.path.join(CACHE_DIR, 'token_stats.json')
+
+_lock = threading.Lock()
+_observations = None
+
+
+def _load_observations():
+    """Load persisted completion lengths, once per process.
+
+    Returns:
+        dict: Mapping of "model_id|complexity" to a deque of token counts
+    """
+    global _observations
+    if _observations is None:
+        _observations = {}
+        try:
+            with open(STATS_PATH, 'r', encoding='utf-8') as f:
+                for key, values in json.load(f).items():
+                    _observations[key] = deque(values, maxlen=HISTORY_SIZE)
+        except (OSError, ValueError):
+            pass
+    return _observations
+
+
+def _save_observations(observations):
+    """Persist completion lengths so budgets survive restarts."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{STATS_PATH}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({key: list(values) for key, values in observations.items()}, f)
+        os.replace(tmp_path, STATS_PATH)
+    except OSError as e:
+        print(f"Could not persist token stats: {e}")
+
+
+def _key(model_id, complexity):
+    return f"{model_id}|{complexity or 'Custom'}"
+
+
+def get_token_budget(model_id, complexity=None):
+    """Return the max_tokens budget for a model and problem complexity.
+
+    Until enough completions have been observed the configured default for
+    the complexity is used. Afterwards the budget is the 95th percentile of
+    observed completion lengths plus headroom, clamped to the global bounds.
+
+    Args:
+        model_id (str): OpenRouter model identifier
+        complexity (str, optional): 'Easy', 'Medium', 'Complex' or None for custom prompts
+
+    Returns:
+        int: Token budget for the request
+    """
+    default = DEFAULT_TOKEN_BUDGETS.get(complexity, MAX_TOKENS)
+    with _lock:
+        values = sorted(_load_observations().get(_key(model_id, complexity), ()))
+
+    if len(values) < TOKEN_BUDGET_MIN_SAMPLES:
+        return default
+
+    p95 = values[min(len(values) - 1, math.ceil(0.95 * len(values)) - 1)]
+    budget = math.ceil(p95 * TOKEN_BUDGET_HEADROOM)
+    return max(MIN_TOKEN_BUDGET, min(MAX_TOKEN_BUDGET, budget))
+
+
+def record_completion_tokens(model_id, complexity, completion_tokens):
+    """Record the length of a complete (not truncated) generation.
+
+    Args:
+        model_id (str): OpenRouter model identifier
+        complexity (str, optional): Problem complexity or None for custom prompts
+        completion_tokens (int): Total completion tokens including continuations
+    """
+    if not completion_tokens:
+        return
+    with _lock:
+        observations = _load_observations()
+        key = _key(model_id, complexity)
+        observations.setdefault(key, deque(maxlen=HISTORY_SIZE)).append(int(completion_tokens))
+        _save_observations(observations)
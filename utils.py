@@ -1,4 +1,6 @@
+import hashlib
 import os
+
 import pandas as pd
 import streamlit as st
 
@@ -34,3 +36,21 @@ def is_code_safe(code: str) -> bool:
         "os.", "sys.", "subprocess", "shutil", "open(", "eval(", "exec("
     ]
     return not any(term in code for term in blacklist)
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """Compute a content fingerprint for a DataFrame.
+    
+    The fingerprint covers column names, dtypes and every cell value, so it
+    changes whenever the data does and can key caches of derived results.
+    
+    Args:
+        df (pd.DataFrame): Dataset to fingerprint
+        
+    Returns:
+        str: Hex digest identifying the dataset contents
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(zip(df.columns, df.dtypes.astype(str)))).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()